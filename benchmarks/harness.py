@@ -0,0 +1,169 @@
+"""
+Client side shared by the benchmarks that drive a real server (scaling.py,
+loadgen.py): viewer processes that record when control events arrive, and a
+controller that takes control of a room and sends a script of commands.
+"""
+import asyncio
+import multiprocessing
+import os
+import socket
+import sys
+import time
+
+import aiohttp
+import socketio
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import wire  # noqa: E402
+from latency_window import percentile  # noqa: E402
+
+CONTROL_EVENTS = {"play": "sync_play", "pause": "sync_pause", "seek": "sync_seek"}
+
+
+def wait_for_port(port, timeout=30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server did not start listening on port {port}")
+
+
+def wait_for_server(port, workers=0):
+    """Waits for the server (or the launcher's proxy) on `port` and its `workers` on the following ports."""
+    wait_for_port(port)
+    for i in range(workers):
+        wait_for_port(port + 1 + i)
+
+
+def summarize(samples):
+    """Count and millisecond percentiles of latency samples (seconds)."""
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "p50": (percentile(ordered, 50) or 0.0) * 1000,
+        "p95": (percentile(ordered, 95) or 0.0) * 1000,
+        "p99": (percentile(ordered, 99) or 0.0) * 1000,
+        "max": (ordered[-1] if ordered else 0.0) * 1000,
+    }
+
+
+# --- Viewers ---
+
+async def run_viewers(url, room, encoding, events, count, duration, ready, results):
+    """Connects `count` viewers and records (media time, issued_at, receipt time) of every event in `events`."""
+    receipts = []
+    clients = []
+
+    def on_event(payload):
+        received = time.time()
+        data = wire.decode(payload)[1] if isinstance(payload, bytes) else payload
+        receipts.append((data['time'], data.get('issued_at'), received))
+
+    async def connect_viewer():
+        client = socketio.AsyncClient(reconnection=False)
+        for event in events:
+            client.on(event, on_event)
+        await client.connect(f"{url}?room={room}&wire={encoding}", transports=['websocket'])
+        clients.append(client)
+
+    for start in range(0, count, 100):
+        await asyncio.gather(*(connect_viewer() for _ in range(start, min(count, start + 100))))
+
+    ready.set()
+    await asyncio.sleep(duration)
+    await asyncio.gather(*(client.disconnect() for client in clients), return_exceptions=True)
+    results.put(receipts)
+
+
+def viewer_process(url, room, encoding, events, count, duration, ready, results):
+    asyncio.run(run_viewers(url, room, encoding, events, count, duration, ready, results))
+
+
+class ViewerFleet:
+    """`viewers` viewers spread over `procs` processes, so the client side doesn't bottleneck on one core."""
+
+    def __init__(self, url, room, viewers, procs, duration, events=tuple(CONTROL_EVENTS.values()),
+                 encoding=wire.JSON):
+        self.results = multiprocessing.Queue()
+        self.ready = []
+        self.procs = []
+        per_proc = max(1, viewers // procs)
+        for i in range(procs):
+            count = per_proc if i < procs - 1 else viewers - per_proc * (procs - 1)
+            ready = multiprocessing.Event()
+            self.ready.append(ready)
+            self.procs.append(multiprocessing.Process(
+                target=viewer_process, args=(url, room, encoding, events, count, duration, ready, self.results)))
+
+    def start(self, timeout=300):
+        """Starts the processes and waits until every viewer is connected."""
+        for proc in self.procs:
+            proc.start()
+        for ready in self.ready:
+            ready.wait(timeout=timeout)
+
+    def receipts(self):
+        """Waits for the viewers to finish and returns every (media time, issued_at, receipt time)."""
+        receipts = []
+        for _ in self.procs:
+            receipts.extend(self.results.get())
+        for proc in self.procs:
+            proc.join()
+        return receipts
+
+
+# --- Controller ---
+
+async def take_control(client, url, room):
+    """
+    Connects `client` to `room` and becomes its controller by uploading a
+    stub video. Returns the fencing token control events must present.
+    """
+    loop = asyncio.get_running_loop()
+    session = loop.create_future()
+    loaded = loop.create_future()
+    client.on('session', lambda data: session.done() or session.set_result(data['member_id']))
+    client.on('video_loaded', lambda data: loaded.done() or loaded.set_result(data['token']))
+    await client.connect(f"{url}?room={room}", transports=['websocket'])
+    # Uploads are attributed to our member id, not the Socket.IO sid
+    member_id = await asyncio.wait_for(session, timeout=10)
+
+    video = b'\0' * 1024
+    async with aiohttp.ClientSession() as http:
+        create = {'filename': 'bench.mp4', 'size': len(video), 'sid': member_id, 'room': room}
+        async with http.post(f"{url}/uploads", json=create) as response:
+            response.raise_for_status()
+            upload_url = (await response.json())['url']
+        async with http.patch(f"{url}{upload_url}", data=video, headers={'Upload-Offset': '0'}) as response:
+            response.raise_for_status()
+    token = await asyncio.wait_for(loaded, timeout=10)
+    await asyncio.sleep(0.5)
+    return token
+
+
+async def run_controller(url, room, script, events, rate):
+    """
+    Takes control of the room, then sends `events` commands cycling through
+    `script` at `rate` per second. Returns {media time: send time}.
+    """
+    client = socketio.AsyncClient(reconnection=False)
+    token = await take_control(client, url, room)
+
+    # Every command uses a distinct media time, so receipts can be matched to sends
+    sent = {}
+    interval = 1.0 / rate if rate > 0 else 0.0
+    for i in range(events):
+        command = script[i % len(script)]
+        media_time = float(i + 1)
+        sent[media_time] = time.time()
+        await client.emit(command, {'time': media_time, 'token': token})
+        if interval:
+            await asyncio.sleep(interval)
+
+    await client.disconnect()
+    return sent
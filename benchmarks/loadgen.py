@@ -0,0 +1,198 @@
+"""
+Load generator: N simulated viewers and one controller against a local server.
+
+Starts server.py (or launcher.py with --workers N), connects the viewers
+from several processes, lets the controller become the room's controller by
+uploading a stub video, and then drives a play/pause/seek script. Reports:
+
+    * fan-out latency (server receipt of the command -> viewer receipt) and
+      end-to-end latency (controller send -> viewer receipt) percentiles
+    * delivered sync events per second and the delivery ratio
+    * CPU and RSS of the server process tree (sampled with psutil)
+    * Redis commands per second during the run (INFO stats)
+
+    pip install -r benchmarks/requirements.txt
+    python benchmarks/loadgen.py --viewers 2000 --events 120 --script play,seek,pause
+    python benchmarks/loadgen.py --workers 4 --viewers 5000 --wire binary --output run.json
+
+Needs a local Redis (see guide.txt). --backend memory runs a standalone
+server on the in-process state backend instead: no Redis at all, and the
+zero-hop baseline to compare the Redis numbers against. Results are printed
+(and optionally written) as JSON, so runs of different releases can be
+compared.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import psutil
+import redis
+
+from harness import REPO_ROOT, CONTROL_EVENTS, ViewerFleet, run_controller, summarize, wait_for_server
+import wire
+
+SERVER = os.path.join(REPO_ROOT, 'server.py')
+LAUNCHER = os.path.join(REPO_ROOT, 'launcher.py')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--viewers', type=int, default=1000, help="Simulated viewers")
+    parser.add_argument('--client-procs', type=int, default=4, help="Processes used to host the viewers")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="Server workers behind launcher.py; 0 runs a single standalone server.py")
+    parser.add_argument('--script', default='play,seek,pause',
+                        help="Comma-separated control commands (play/pause/seek), repeated for --events commands")
+    parser.add_argument('--events', type=int, default=60, help="Control commands sent by the controller")
+    parser.add_argument('--rate', type=float, default=2.0,
+                        help="Control commands per second (keep seeks slower than the coalescing window)")
+    parser.add_argument('--wire', choices=(wire.JSON, wire.BINARY), default=wire.JSON, help="Viewer encoding")
+    parser.add_argument('--backend', choices=('redis', 'memory'), default='redis',
+                        help="Server state backend; memory is single-process only (no --workers)")
+    parser.add_argument('--port', type=int, default=5700, help="Port of the server (or of the launcher's proxy)")
+    parser.add_argument('--redis-url', default=os.environ.get('REDIS_URL', 'redis://localhost:6379/0'))
+    parser.add_argument('--output', help="Also write the JSON report to this file")
+    return parser.parse_args()
+
+
+# --- Server Side Measurements ---
+
+class ProcessSampler(threading.Thread):
+    """Samples CPU and RSS of a process and all of its children."""
+
+    def __init__(self, pid, interval=0.5):
+        super().__init__(daemon=True)
+        self.root = psutil.Process(pid)
+        self.interval = interval
+        self.cpu = []
+        self.rss = []
+        self.stopped = threading.Event()
+
+    def processes(self):
+        try:
+            return [self.root] + self.root.children(recursive=True)
+        except psutil.NoSuchProcess:
+            return []
+
+    def run(self):
+        for proc in self.processes():
+            proc.cpu_percent(None)  # Prime the counters
+        while not self.stopped.wait(self.interval):
+            cpu = rss = 0.0
+            for proc in self.processes():
+                try:
+                    cpu += proc.cpu_percent(None)
+                    rss += proc.memory_info().rss
+                except psutil.NoSuchProcess:
+                    pass
+            self.cpu.append(cpu)
+            self.rss.append(rss)
+
+    def report(self):
+        return {
+            "cpu_percent_avg": sum(self.cpu) / len(self.cpu) if self.cpu else 0.0,
+            "cpu_percent_max": max(self.cpu, default=0.0),
+            "rss_mb_max": max(self.rss, default=0.0) / 1e6,
+        }
+
+
+def redis_commands(client):
+    if client is None:
+        return 0
+    return int(client.info('stats')['total_commands_processed'])
+
+
+def start_server(args, redis_url):
+    env = dict(os.environ, ECHOSTREAM_STATE_BACKEND=args.backend)
+    if redis_url:
+        env["REDIS_URL"] = redis_url
+    if args.workers:
+        command = [sys.executable, LAUNCHER, '--workers', str(args.workers), '--host', '127.0.0.1',
+                   '--port', str(args.port), '--worker-base-port', str(args.port + 1)]
+    else:
+        command = [sys.executable, SERVER]
+        env.update(ECHOSTREAM_HOST='127.0.0.1', ECHOSTREAM_PORT=str(args.port))
+    server = subprocess.Popen(command, cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL)
+    wait_for_server(args.port, args.workers)
+    return server
+
+
+def run(args):
+    script = [command.strip() for command in args.script.split(',') if command.strip()]
+    unknown = [command for command in script if command not in CONTROL_EVENTS]
+    if not script or unknown:
+        sys.exit(f"Invalid --script: {args.script}")
+
+    if args.backend == 'memory':
+        if args.workers:
+            sys.exit("--backend memory runs a single server process; drop --workers")
+        redis_url, stats = None, None
+    else:
+        redis_url = args.redis_url
+        stats = redis.Redis.from_url(redis_url)
+    url = f"http://127.0.0.1:{args.port}"
+    room = f"loadgen-{int(time.time())}"
+    server = start_server(args, redis_url)
+    sampler = ProcessSampler(server.pid)
+    try:
+        duration = args.events / args.rate + 10.0 if args.rate > 0 else 20.0
+        viewers = ViewerFleet(url, room, args.viewers, args.client_procs, duration, encoding=args.wire)
+        viewers.start()
+
+        sampler.start()
+        commands_before = redis_commands(stats)
+        started = time.time()
+        sent = asyncio.run(run_controller(url, room, script, args.events, args.rate))
+        receipts = viewers.receipts()
+        elapsed = max(1e-9, time.time() - started)
+        commands = redis_commands(stats) - commands_before
+        sampler.stopped.set()
+        sampler.join()
+    finally:
+        server.terminate()
+        server.wait(timeout=15)
+
+    matched = [(media_time, issued_at, received) for media_time, issued_at, received in receipts if media_time in sent]
+    last_receipt = max((received for _, _, received in matched), default=started)
+    delivery_window = max(1e-9, last_receipt - started)
+    expected = args.viewers * args.events
+    return {
+        "benchmark": "loadgen",
+        "config": {
+            "viewers": args.viewers,
+            "workers": args.workers,
+            "backend": args.backend,
+            "script": script,
+            "events": args.events,
+            "rate": args.rate,
+            "wire": args.wire,
+        },
+        "results": {
+            "deliveries": len(matched),
+            "delivery_ratio": len(matched) / expected if expected else 0.0,
+            "deliveries_per_sec": len(matched) / delivery_window,
+            "fanout_latency_ms": summarize([received - issued_at for _, issued_at, received in matched if issued_at]),
+            "end_to_end_latency_ms": summarize([received - sent[media_time] for media_time, _, received in matched]),
+            "server": sampler.report(),
+            "redis": {"commands": commands, "ops_per_sec": commands / elapsed} if stats else None,
+        },
+    }
+
+
+def main():
+    args = parse_args()
+    report = run(args)
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + "\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Multi-worker scaling benchmark.
+
+Starts launcher.py with an increasing number of workers, connects a set of
+simulated viewers plus one controller through the sticky proxy, fires a
+burst of seek events and measures how many sync events per second the
+deployment fans out and with what latency.
+
+    pip install -r benchmarks/requirements.txt
+    python benchmarks/scaling.py --workers 1,2,4 --viewers 1000 --events 300
+
+Requires a local Redis (see guide.txt). Results are printed as JSON.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+from harness import REPO_ROOT, ViewerFleet, run_controller, summarize, wait_for_server
+
+LAUNCHER = os.path.join(REPO_ROOT, 'launcher.py')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', default='1,2,4', help="Comma-separated worker counts to compare")
+    parser.add_argument('--viewers', type=int, default=1000, help="Simulated viewers per run")
+    parser.add_argument('--client-procs', type=int, default=4, help="Processes used to host the viewers")
+    parser.add_argument('--events', type=int, default=300, help="Seek events sent by the controller")
+    parser.add_argument('--rate', type=float, default=100.0, help="Seek events per second")
+    parser.add_argument('--port', type=int, default=5600, help="Proxy port used by the launcher")
+    return parser.parse_args()
+
+
+def run_once(args, workers):
+    url = f"http://127.0.0.1:{args.port}"
+    room = f"bench-{workers}-{int(time.time())}"
+    launcher = subprocess.Popen(
+        [sys.executable, LAUNCHER, '--workers', str(workers),
+         '--host', '127.0.0.1', '--port', str(args.port), '--worker-base-port', str(args.port + 1)],
+        cwd=REPO_ROOT, stdout=subprocess.DEVNULL,
+        # Measure raw fan-out: every seek must reach every viewer, not just the last of a burst
+        env=dict(os.environ, ECHOSTREAM_SEEK_COALESCE_WINDOW='0')
+    )
+    try:
+        wait_for_server(args.port, workers)
+
+        duration = args.events / args.rate + 10.0 if args.rate > 0 else 20.0
+        viewers = ViewerFleet(url, room, args.viewers, args.client_procs, duration, events=('sync_seek',))
+        viewers.start(timeout=120)
+
+        started = time.time()
+        sent = asyncio.run(run_controller(url, room, ['seek'], args.events, args.rate))
+        receipts = viewers.receipts()
+
+        latencies = [received - sent[media_time] for media_time, _, received in receipts if media_time in sent]
+        last_receipt = max((received for _, _, received in receipts), default=started)
+        elapsed = max(1e-9, last_receipt - started)
+        expected = args.viewers * args.events
+        return {
+            "workers": workers,
+            "viewers": args.viewers,
+            "events_sent": args.events,
+            "deliveries": len(latencies),
+            "delivery_ratio": len(latencies) / expected if expected else 0.0,
+            "deliveries_per_sec": len(latencies) / elapsed,
+            "latency_ms": summarize(latencies),
+        }
+    finally:
+        launcher.terminate()
+        launcher.wait(timeout=15)
+
+
+def main():
+    args = parse_args()
+    runs = [run_once(args, int(workers)) for workers in args.workers.split(',')]
+    baseline = runs[0]["deliveries_per_sec"] or 1.0
+    for run in runs:
+        run["speedup"] = run["deliveries_per_sec"] / baseline
+    print(json.dumps({"benchmark": "scaling", "runs": runs}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,588 @@
+"""
+Deterministic sync-protocol simulator.
+
+A discrete-event simulation of one room on a virtual clock: the server's
+control handling (the in-memory state backend's fenced, versioned
+transitions and event stream, plus playback.py's adaptive p95 play lead,
+seek coalescing and sync ticks, as server.py uses them), a controller
+driving a random play/pause/seek/scrub script, and N viewers running a port
+of the client.js sync logic (Cristian clock sync, schedulePlay, the
+playbackRate drift controller, the isServerSyncing hold-offs).
+
+Every viewer has its own clock skew, network latency, jitter and packet
+loss (modelled as a TCP retransmission delay, since Socket.IO never drops
+messages), a slightly inaccurate playback rate, and seek/start decode
+delays. The simulator samples each viewer's position error against the
+server's authoritative position and counts the seeks every viewer makes.
+
+Runs in seconds with the standard library only (no Redis), and the same seed always
+gives the same result:
+
+    python benchmarks/sync_sim.py --players 50 --duration 600 --seed 1
+    python benchmarks/sync_sim.py --set drift_deadband=0.03 --set rate_gain=0.8
+    python benchmarks/sync_sim.py --max-p95-error-ms 120 --max-seeks-per-player 40   # exits 1 on regression
+
+Server-side tuning comes from sync_config.py, so ECHOSTREAM_* environment
+variables apply; client tuning can be overridden with --set. Results are
+printed as JSON.
+"""
+import argparse
+import heapq
+import json
+import os
+import random
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import playback  # noqa: E402
+import sync_config  # noqa: E402
+import wire  # noqa: E402
+from latency_window import LatencyWindow, percentile  # noqa: E402
+from memory_backend import MemoryBackend  # noqa: E402
+
+ROOM = "sim"
+CONTROLLER = "controller"
+
+# Client-side constants from client.js that are not part of sync_config
+CLIENT_DEFAULTS = {
+    "seek_settle": 1.0,            # isServerSyncing hold-off after a sync_seek
+    "time_sync_samples": 8,
+    "time_sync_spacing": 0.1,
+    "time_sync_refresh": 60.0,
+}
+TCP_RETRANSMIT_TIMEOUT = 0.2
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--players', type=int, default=50, help="Simulated viewers")
+    parser.add_argument('--duration', type=float, default=600.0, help="Simulated seconds")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--latency', type=float, default=0.04, help="Mean one-way latency (s)")
+    parser.add_argument('--latency-spread', type=float, default=0.03,
+                        help="Std deviation of the per-player mean latency (s)")
+    parser.add_argument('--jitter', type=float, default=0.01, help="Per-message latency jitter (s)")
+    parser.add_argument('--loss', type=float, default=0.01, help="Probability a message needs a retransmission")
+    parser.add_argument('--clock-skew', type=float, default=2.0, help="Std deviation of player clock offsets (s)")
+    parser.add_argument('--rate-error', type=float, default=0.0005,
+                        help="Std deviation of the players' actual playback speed around 1.0")
+    parser.add_argument('--seek-delay', type=float, default=0.15, help="Mean decode delay after a seek (s)")
+    parser.add_argument('--start-delay', type=float, default=0.05, help="Mean delay before play() starts (s)")
+    parser.add_argument('--action-interval', type=float, default=15.0, help="Mean time between controller actions (s)")
+    parser.add_argument('--sample-interval', type=float, default=0.1, help="Sync error sampling period (s)")
+    parser.add_argument('--settle', type=float, default=2.0,
+                        help="Samples this soon after a state change are excluded from the steady-state figures")
+    parser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE',
+                        help="Override a client tuning value (see sync_config.client_sync_config and CLIENT_DEFAULTS)")
+    parser.add_argument('--max-p95-error-ms', type=float, help="Exit 1 if the steady-state p95 error is above this")
+    parser.add_argument('--max-seeks-per-player', type=float, help="Exit 1 if viewers seek more than this on average")
+    return parser.parse_args()
+
+
+# --- Discrete-Event Core ---
+
+class Simulation:
+    """Virtual clock and event queue. Ties are broken by scheduling order, so runs are reproducible."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.queue = []
+        self.sequence = 0
+
+    def at(self, when, callback, *args):
+        self.sequence += 1
+        heapq.heappush(self.queue, (when, self.sequence, callback, args))
+
+    def after(self, delay, callback, *args):
+        self.at(self.now + max(0.0, delay), callback, *args)
+
+    def run_until(self, end):
+        while self.queue and self.queue[0][0] <= end:
+            self.now, _, callback, args = heapq.heappop(self.queue)
+            callback(*args)
+        self.now = end
+
+
+class Link:
+    """One direction of a Socket.IO connection: ordered delivery with latency, jitter and retransmissions."""
+
+    def __init__(self, sim, rng, latency, jitter, loss):
+        self.sim = sim
+        self.rng = rng
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.last_delivery = 0.0
+
+    def send(self, callback, *args):
+        delay = max(0.001, self.rng.gauss(self.latency, self.jitter))
+        while self.rng.random() < self.loss:
+            delay += TCP_RETRANSMIT_TIMEOUT
+        # TCP: nothing overtakes an earlier message on the same connection
+        delivery = max(self.sim.now + delay, self.last_delivery)
+        self.last_delivery = delivery
+        self.sim.at(delivery, callback, *args)
+
+
+# --- Server ---
+
+class Server:
+    """
+    One server.py node serving the room. State, fencing and the event stream
+    are a real MemoryBackend on the virtual clock, and the play lead, seek
+    coalescing and tick payloads come from playback.py, the module server.py
+    uses. Only the glue is mirrored here: the Socket.IO handlers
+    (handle_play/pause/seek), the stream listener (relay), sync_ticker
+    (tick) and presence_heartbeat (heartbeat), with the background tasks'
+    sleeps turned into scheduled events.
+    """
+
+    def __init__(self, sim):
+        self.sim = sim
+        self.backend = MemoryBackend(clock=lambda: sim.now)
+        self.players = []
+        self.fanout_latency = LatencyWindow()
+        self.pending_seek = None
+        self.last_change = 0.0
+        self.events_sent = 0
+        # The controller joins and loads the video, which grants it the lease
+        self.backend.join(ROOM, CONTROLLER, sim.now)
+        self.backend.load_video(ROOM, "sim.mp4", CONTROLLER, sim.now)
+        self.token = self.backend.get_state(ROOM)["controller_token"]
+        self.stream_position = "0-0"
+
+    @property
+    def version(self):
+        return int(self.backend.get_state(ROOM).get("version", 0))
+
+    def playback_state(self, now):
+        """(authoritative media time at `now`, playing)"""
+        return playback.media_position(self.backend.get_state(ROOM), now)
+
+    def play_lead_time(self):
+        return playback.play_lead_time(self.fanout_latency)
+
+    def transition(self, event, media_time, effective_at, playing=None):
+        # apply_control_transition
+        now = self.sim.now
+        playing_flag = "" if playing is None else ("1" if playing else "0")
+        if self.backend.control_transition(ROOM, CONTROLLER, self.token, event, media_time, effective_at,
+                                           playing_flag, now):
+            self.last_change = now
+            self.relay()
+
+    def relay(self):
+        # event_listener: forward new stream entries, decoded as for JSON clients
+        for _, entries in self.backend.read_events({ROOM: self.stream_position}, sync_config.EVENT_READ_COUNT, 0):
+            for entry_id, fields in entries:
+                self.stream_position = entry_id
+                if b'wire' not in fields:
+                    continue  # video_loaded / controller_change
+                event, data = wire.decode(fields[b'wire'])
+                for player in self.players:
+                    self.events_sent += 1
+                    player.downlink.send(player.on_event, event, data)
+
+    def handle_play(self, media_time):
+        self.pending_seek = None
+        play_at = self.sim.now + self.play_lead_time()
+        self.transition("sync_play", media_time, play_at, playing=True)
+
+    def handle_pause(self, media_time):
+        self.pending_seek = None
+        self.transition("sync_pause", media_time, self.sim.now, playing=False)
+
+    def handle_seek(self, media_time):
+        now = self.sim.now
+        if sync_config.SEEK_COALESCE_WINDOW <= 0:
+            self.transition("sync_seek", media_time, now)
+            return
+        # queue_seek
+        if self.pending_seek is not None:
+            self.pending_seek.update(CONTROLLER, self.token, media_time, now)
+            return
+        self.pending_seek = playback.PendingSeek(CONTROLLER, self.token, media_time, now)
+        self.flush_seek(self.pending_seek)
+
+    def flush_seek(self, pending):
+        if self.pending_seek is not pending:
+            return
+        due = pending.due()
+        if due > self.sim.now:
+            self.sim.at(due, self.flush_seek, pending)
+            return
+        self.pending_seek = None
+        self.transition("sync_seek", pending.current_time, pending.received_at)
+
+    def handle_time_sync(self, player):
+        player.downlink.send(player.on_time_sync_reply, self.sim.now)
+
+    def handle_sync_ack(self, issued_at, received_at):
+        self.fanout_latency.add(received_at - issued_at)
+
+    def tick(self):
+        tick = playback.tick_fields(self.backend.get_state(ROOM))
+        for player in self.players:
+            self.events_sent += 1
+            player.downlink.send(player.on_tick, tick)
+        self.sim.after(sync_config.SYNC_TICK_INTERVAL, self.tick)
+
+    def heartbeat(self):
+        # Keeps the controller's lease alive, or its commands would be fenced off
+        self.backend.heartbeat([(ROOM, [CONTROLLER], CONTROLLER)], self.sim.now)
+        self.sim.after(sync_config.PRESENCE_HEARTBEAT_INTERVAL, self.heartbeat)
+
+
+# --- Viewer ---
+
+class Player:
+    """A browser tab: a video element model plus a port of client.js's viewer-side sync logic."""
+
+    def __init__(self, sim, server, rng, args, config):
+        self.sim = sim
+        self.server = server
+        self.rng = rng
+        self.config = config
+        latency = max(0.002, rng.gauss(args.latency, args.latency_spread))
+        self.uplink = Link(sim, random.Random(rng.random()), latency, args.jitter, args.loss)
+        self.downlink = Link(sim, random.Random(rng.random()), latency, args.jitter, args.loss)
+        self.clock_skew = rng.gauss(0.0, args.clock_skew)
+        self.speed = rng.gauss(1.0, args.rate_error)
+        self.seek_delay = args.seek_delay
+        self.start_delay = args.start_delay
+
+        # client.js state
+        self.clock_offset = 0.0
+        self.state_version = 0
+        self.is_server_syncing = False
+        self.scheduled_play = None
+        self.sync_release = None
+        self.clock_samples = []
+
+        # Video element
+        self.position = 0.0
+        self.position_at = 0.0    # True time `position` was last updated
+        self.paused = True
+        self.playback_rate = 1.0
+        self.frozen_until = 0.0   # Decoding after a seek / starting playback
+        self.seeks = 0
+        self.rate_changes = 0
+
+    # Video element model
+
+    def current_time(self):
+        now = self.sim.now
+        if self.paused or now <= self.frozen_until:
+            return self.position
+        start = max(self.position_at, self.frozen_until)
+        return self.position + (now - start) * self.playback_rate * self.speed
+
+    def settle(self):
+        self.position = self.current_time()
+        self.position_at = self.sim.now
+
+    def seek(self, target):
+        self.settle()
+        self.position = target
+        self.frozen_until = self.sim.now + max(0.0, self.rng.gauss(self.seek_delay, self.seek_delay / 3))
+        self.seeks += 1
+
+    def play(self, on_started=None):
+        if self.paused:
+            self.settle()
+            self.paused = False
+            self.frozen_until = max(self.frozen_until,
+                                    self.sim.now + max(0.0, self.rng.gauss(self.start_delay, self.start_delay / 3)))
+        if on_started:
+            self.sim.at(self.frozen_until, on_started)
+
+    def pause(self):
+        self.settle()
+        self.paused = True
+
+    def set_rate(self, rate):
+        if rate != self.playback_rate:
+            self.settle()
+            self.playback_rate = rate
+            self.rate_changes += 1
+
+    # Clock sync (Cristian, lowest RTT of a burst of probes)
+
+    def local_time(self):
+        return self.sim.now + self.clock_skew
+
+    def server_now(self):
+        return self.local_time() + self.clock_offset
+
+    def sync_clock(self):
+        self.clock_samples = []
+        for i in range(int(self.config["time_sync_samples"])):
+            self.sim.after(i * self.config["time_sync_spacing"], self.sample_clock)
+        self.sim.after(self.config["time_sync_refresh"], self.sync_clock)
+
+    def sample_clock(self):
+        sent = self.local_time()
+        self.uplink.send(self.server.handle_time_sync, self)
+        self.clock_samples.append([sent, None])
+
+    def on_time_sync_reply(self, server_time):
+        t1 = self.local_time()
+        pending = [sample for sample in self.clock_samples if sample[1] is None]
+        if not pending:
+            return
+        sample = pending[0]
+        t0 = sample[0]
+        sample[1] = (t1 - t0, server_time - (t0 + (t1 - t0) / 2))
+        done = [s[1] for s in self.clock_samples if s[1] is not None]
+        self.clock_offset = min(done)[1]
+
+    # client.js handlers
+
+    def position_from(self, media_time, since, playing):
+        if not playing or not since:
+            return media_time
+        return media_time + max(0.0, self.server_now() - since)
+
+    def accept_version(self, version, snapshot):
+        if version < self.state_version or (version == self.state_version and not snapshot):
+            return False
+        self.state_version = version
+        return True
+
+    def correct_drift(self, server_time, playing):
+        drift = server_time - self.current_time()
+        threshold = self.config["hard_seek_threshold"] if playing else self.config["seek_threshold"]
+        if abs(drift) > threshold:
+            self.set_rate(1.0)
+            self.seek(server_time)
+        elif playing and abs(drift) > self.config["drift_deadband"]:
+            limit = self.config["max_rate_adjustment"]
+            self.set_rate(1.0 + max(-limit, min(limit, self.config["rate_gain"] * drift)))
+        elif self.playback_rate != 1.0:
+            self.set_rate(1.0)
+
+    def sync_playback(self, server_time, playing):
+        if not self.is_server_syncing:
+            self.correct_drift(server_time, playing)
+        if playing and self.paused:
+            self.play()
+        elif not playing and not self.paused:
+            self.pause()
+
+    def on_tick(self, tick):
+        if not self.accept_version(tick["v"], True):
+            return
+        playing = tick["p"] == 1
+        self.sync_playback(self.position_from(tick["t"], tick["u"], playing), playing)
+
+    def ack(self, data):
+        if self.rng.random() < self.config["fanout_ack_sample_rate"]:
+            self.uplink.send(self.server.handle_sync_ack, data["issued_at"], self.server_now())
+
+    def cancel_scheduled_play(self):
+        if self.scheduled_play is not None:
+            self.scheduled_play = None
+            self.is_server_syncing = False
+
+    def schedule_play(self, media_time, play_at):
+        self.cancel_scheduled_play()
+        self.is_server_syncing = True
+        self.set_rate(1.0)
+        delay = play_at - self.server_now()
+        if delay > 0:
+            if not self.paused:
+                self.pause()
+            if abs(self.current_time() - media_time) > self.config["seek_threshold"]:
+                self.seek(media_time)
+        token = object()
+        self.scheduled_play = token
+        self.sim.after(delay, self.start_scheduled_play, token, media_time, play_at)
+
+    def start_scheduled_play(self, token, media_time, play_at):
+        if self.scheduled_play is not token:
+            return
+        self.scheduled_play = None
+        target = self.position_from(media_time, play_at, True)
+        if abs(self.current_time() - target) > self.config["seek_threshold"]:
+            self.seek(target)
+        self.play(on_started=self.release_sync)
+
+    def release_sync(self):
+        self.is_server_syncing = False
+
+    def on_event(self, event, data):
+        if not self.accept_version(data["version"], False):
+            return
+        self.ack(data)
+        if event == "sync_play":
+            self.schedule_play(data["time"], data["updated_at"])
+        elif event == "sync_pause":
+            self.cancel_scheduled_play()
+            self.pause()
+            if abs(self.current_time() - data["time"]) > self.config["seek_threshold"]:
+                self.seek(data["time"])
+        elif event == "sync_seek":
+            self.is_server_syncing = True
+            self.set_rate(1.0)
+            self.seek(self.position_from(data["time"], data["updated_at"], data["playing"]))
+            token = object()
+            self.sync_release = token
+            self.sim.after(self.config["seek_settle"], self.release_seek_hold, token)
+
+    def release_seek_hold(self, token):
+        if self.sync_release is token:
+            self.is_server_syncing = False
+
+
+# --- Controller ---
+
+class Controller:
+    """Issues a random play/pause/seek/scrub script. Its own playback is assumed perfect."""
+
+    def __init__(self, sim, server, rng, args):
+        self.sim = sim
+        self.server = server
+        self.rng = rng
+        self.action_interval = args.action_interval
+        self.uplink = Link(sim, random.Random(rng.random()), args.latency, args.jitter, args.loss)
+        self.actions = {"play": 0, "pause": 0, "seek": 0, "scrub": 0}
+
+    def start(self):
+        self.sim.after(1.0, self.send, "play", 0.0)
+        self.sim.after(1.0 + self.rng.expovariate(1.0 / self.action_interval), self.act)
+
+    def send(self, command, media_time):
+        handler = {"play": self.server.handle_play, "pause": self.server.handle_pause,
+                   "seek": self.server.handle_seek}[command]
+        self.uplink.send(handler, media_time)
+
+    def act(self):
+        position, playing = self.server.playback_state(self.sim.now)
+        roll = self.rng.random()
+        if not playing:
+            self.actions["play"] += 1
+            self.send("play", position)
+        elif roll < 0.25:
+            self.actions["pause"] += 1
+            self.send("pause", position)
+        elif roll < 0.7:
+            self.actions["seek"] += 1
+            self.send("seek", self.rng.uniform(0, 3600))
+        else:
+            # Dragging the scrubber: a burst of seeks 50 ms apart
+            self.actions["scrub"] += 1
+            target = position
+            for i in range(self.rng.randint(5, 20)):
+                target = max(0.0, target + self.rng.uniform(-30, 30))
+                self.sim.after(i * 0.05, self.send, "seek", target)
+        self.sim.after(self.rng.expovariate(1.0 / self.action_interval), self.act)
+
+
+# --- Run ---
+
+def client_config(overrides):
+    config = dict(sync_config.client_sync_config())
+    config.update(CLIENT_DEFAULTS)
+    for override in overrides:
+        name, _, value = override.partition("=")
+        if name not in config:
+            sys.exit(f"Unknown tuning value: {name}")
+        config[name] = float(value)
+    return config
+
+
+def simulate(args):
+    rng = random.Random(args.seed)
+    sim = Simulation()
+    server = Server(sim)
+    config = client_config(args.set)
+    players = [Player(sim, server, random.Random(rng.random()), args, config) for _ in range(args.players)]
+    server.players = players
+    controller = Controller(sim, server, random.Random(rng.random()), args)
+
+    errors = []
+    steady_errors = []
+
+    def sample():
+        truth, _ = server.playback_state(sim.now)
+        steady = sim.now - server.last_change >= args.settle
+        for player in players:
+            error = abs(player.current_time() - truth)
+            errors.append(error)
+            if steady:
+                steady_errors.append(error)
+        sim.after(args.sample_interval, sample)
+
+    for player in players:
+        player.sync_clock()
+    sim.after(sync_config.SYNC_TICK_INTERVAL, server.tick)
+    sim.after(sync_config.PRESENCE_HEARTBEAT_INTERVAL, server.heartbeat)
+    controller.start()
+    # Clock sync and the first play have settled after a few seconds
+    sim.at(5.0, sample)
+    sim.run_until(args.duration)
+
+    errors.sort()
+    steady_errors.sort()
+    seeks = sorted(player.seeks for player in players)
+
+    def distribution(values):
+        return {
+            "samples": len(values),
+            "p50": (percentile(values, 50) or 0.0) * 1000,
+            "p95": (percentile(values, 95) or 0.0) * 1000,
+            "p99": (percentile(values, 99) or 0.0) * 1000,
+            "max": (values[-1] if values else 0.0) * 1000,
+            "within_40ms": sum(1 for v in values if v <= 0.04) / len(values) if values else 0.0,
+            "within_100ms": sum(1 for v in values if v <= 0.1) / len(values) if values else 0.0,
+        }
+
+    return {
+        "benchmark": "sync_sim",
+        "config": {
+            "players": args.players,
+            "duration": args.duration,
+            "seed": args.seed,
+            "network": {"latency": args.latency, "latency_spread": args.latency_spread,
+                        "jitter": args.jitter, "loss": args.loss},
+            "clock_skew": args.clock_skew,
+            "client": config,
+        },
+        "results": {
+            "controller_actions": controller.actions,
+            "state_changes": server.version,
+            "events_sent": server.events_sent,
+            "final_play_lead_ms": server.play_lead_time() * 1000,
+            "sync_error_ms": distribution(errors),
+            "steady_sync_error_ms": distribution(steady_errors),
+            "seeks_per_player": {
+                "mean": sum(seeks) / len(seeks) if seeks else 0.0,
+                "p95": percentile(seeks, 95) or 0,
+                "max": seeks[-1] if seeks else 0,
+            },
+            "rate_changes_per_player": sum(p.rate_changes for p in players) / len(players) if players else 0.0,
+        },
+    }
+
+
+def main():
+    args = parse_args()
+    report = simulate(args)
+    print(json.dumps(report, indent=2))
+
+    results = report["results"]
+    failures = []
+    if args.max_p95_error_ms is not None and results["steady_sync_error_ms"]["p95"] > args.max_p95_error_ms:
+        failures.append(f"steady-state p95 error {results['steady_sync_error_ms']['p95']:.1f} ms "
+                        f"> {args.max_p95_error_ms} ms")
+    if args.max_seeks_per_player is not None and results["seeks_per_player"]["mean"] > args.max_seeks_per_player:
+        failures.append(f"{results['seeks_per_player']['mean']:.1f} seeks per player > {args.max_seeks_per_player}")
+    if failures:
+        print("Sync quality regression: " + "; ".join(failures), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""
+Wire format benchmark: JSON vs the compact binary encoding (wire.py).
+
+Replays the life of one playback event through the server with both
+encodings and reports bytes and CPU per event:
+
+    stored  - encode into the room's event stream (cjson vs struct.pack in Lua)
+    listen  - decode the stream entry in the listener (json.loads vs wire.decode)
+    emit    - encode the Socket.IO packet sent to the room with python-socketio's
+              own Packet encoder, as the server does (once per emit)
+    client  - decode on the receiving side (once per viewer)
+
+A JSON event is one text frame `42["name",{...}]`, a binary event the text
+frame `451-["name",{"_placeholder":true,"num":0}]` plus one binary
+attachment frame (the leading `4` is Engine.IO's message type). Frame sizes
+include the WebSocket frame header.
+
+No Redis or server needed, only python-socketio from requirements.txt:
+
+    python benchmarks/wire_format.py --events 200000
+
+Results are printed as JSON.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import wire  # noqa: E402
+from socketio.packet import Packet, EVENT  # noqa: E402
+
+ENGINEIO_MESSAGE = "4"  # Engine.IO packet type prefixed to every text frame
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, default=200000, help="Events encoded per measurement")
+    parser.add_argument('--viewers', type=int, default=1000, help="Viewers per room, to scale per-event totals")
+    return parser.parse_args()
+
+
+def ws_frame_size(payload_length):
+    # Server-to-client frames are unmasked: 2 header bytes, +2 or +8 for longer payloads
+    if payload_length < 126:
+        return 2 + payload_length
+    if payload_length < 65536:
+        return 4 + payload_length
+    return 10 + payload_length
+
+
+def sample_events(count):
+    rng = random.Random(42)
+    now = time.time()
+    events = []
+    for version in range(1, count + 1):
+        name = rng.choice(("sync_play", "sync_pause", "sync_seek"))
+        events.append((name, {
+            "time": rng.uniform(0, 7200),
+            "updated_at": now + rng.uniform(0, 0.5),
+            "issued_at": now,
+            "playing": name == "sync_play",
+            "sid": "w1-" + "%020x" % rng.getrandbits(80),
+            "version": version,
+        }))
+    return events
+
+
+def cpu_per_event(func, items):
+    start = time.process_time()
+    for item in items:
+        func(item)
+    return (time.process_time() - start) / len(items) * 1e6
+
+
+# --- JSON path ---
+
+def json_store(event):
+    return json.dumps(event[1])
+
+
+def json_listen(stored):
+    return json.loads(stored)
+
+
+def json_emit(event):
+    return ENGINEIO_MESSAGE + Packet(EVENT, data=[event[0], event[1]]).encode()
+
+
+def json_client(packet):
+    return json.loads(packet[2:])
+
+
+# --- Binary path ---
+
+def binary_store(event):
+    name, data = event
+    return wire.encode(name, data["time"], data["updated_at"], data["playing"], data["version"], data["issued_at"])
+
+
+def binary_listen(stored):
+    return wire.decode(stored)
+
+
+def binary_emit(event):
+    # The stored bytes are forwarded as the attachment without re-encoding
+    name, packed = event
+    header, attachment = Packet(EVENT, data=[name, packed]).encode()
+    return ENGINEIO_MESSAGE + header, attachment
+
+
+def binary_client(frames):
+    return wire.decode(frames[1])
+
+
+def measure(events):
+    json_stored = [json_store(e) for e in events]
+    json_packets = [json_emit(e) for e in events]
+    binary_stored = [binary_store(e) for e in events]
+    binary_packets = [binary_emit((e[0], p)) for e, p in zip(events, binary_stored)]
+
+    n = len(events)
+    results = {
+        "json": {
+            "stored_bytes": sum(len(s.encode()) for s in json_stored) / n,
+            "frame_bytes": sum(ws_frame_size(len(p.encode())) for p in json_packets) / n,
+            "cpu_us": {
+                "store": cpu_per_event(json_store, events),
+                "listen": cpu_per_event(json_listen, json_stored),
+                "emit": cpu_per_event(json_emit, events),
+                "client": cpu_per_event(json_client, json_packets),
+            },
+        },
+        "binary": {
+            "stored_bytes": sum(len(s) for s in binary_stored) / n,
+            "frame_bytes": sum(ws_frame_size(len(h.encode())) + ws_frame_size(len(p)) for h, p in binary_packets) / n,
+            "cpu_us": {
+                "store": cpu_per_event(binary_store, events),
+                "listen": cpu_per_event(binary_listen, binary_stored),
+                "emit": cpu_per_event(binary_emit, list(zip((e[0] for e in events), binary_stored))),
+                "client": cpu_per_event(binary_client, binary_packets),
+            },
+        },
+    }
+    return results
+
+
+def main():
+    args = parse_args()
+    results = measure(sample_events(args.events))
+    for encoding in results.values():
+        cpu = encoding["cpu_us"]
+        # Store, listen and emit happen once per event and worker; client decoding once per viewer
+        encoding["server_cpu_us_per_event"] = cpu["store"] + cpu["listen"] + cpu["emit"]
+        encoding["fanout_bytes_per_event"] = encoding["frame_bytes"] * args.viewers
+    results["binary_vs_json"] = {
+        "stored_bytes": results["binary"]["stored_bytes"] / results["json"]["stored_bytes"],
+        "frame_bytes": results["binary"]["frame_bytes"] / results["json"]["frame_bytes"],
+        "server_cpu": results["binary"]["server_cpu_us_per_event"] / results["json"]["server_cpu_us_per_event"],
+    }
+    print(json.dumps({"benchmark": "wire_format", "events": args.events, "viewers": args.viewers,
+                      "results": results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
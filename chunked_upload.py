@@ -0,0 +1,87 @@
+"""
+Disk side of the resumable, chunked upload protocol.
+
+An upload is preallocated as a sparse `.part` file of its final size. Every
+chunk is written straight to its final offset with os.pwrite(), so chunks
+can arrive in any order and in parallel, and nothing is ever copied twice.
+When the last chunk lands the file is moved into place with an atomic
+os.replace(). Upload bookkeeping (which chunks arrived) lives in Redis so
+any worker can accept any chunk.
+"""
+import os
+import time
+
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024   # Every chunk but the last has exactly this size
+MAX_UPLOAD_SIZE = 1024 * 1024 * 500
+UPLOAD_TTL = 24 * 60 * 60             # Unfinished uploads are forgotten after a day
+COPY_BUFFER_SIZE = 64 * 1024
+
+
+def chunk_count(size):
+    return (size + UPLOAD_CHUNK_SIZE - 1) // UPLOAD_CHUNK_SIZE
+
+
+def expected_chunk_length(index, size):
+    return min(UPLOAD_CHUNK_SIZE, size - index * UPLOAD_CHUNK_SIZE)
+
+
+def create_partial(path, size):
+    """Creates the sparse destination file for an upload of `size` bytes."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.truncate(size)
+
+
+def write_chunk(path, offset, stream, length):
+    """
+    Copies `length` bytes from the request `stream` to `offset` in `path`.
+    Reads are small so the eventlet hub gets control back between them.
+    Returns the number of bytes written.
+    """
+    fd = os.open(path, os.O_WRONLY)
+    try:
+        written = 0
+        while written < length:
+            data = stream.read(min(COPY_BUFFER_SIZE, length - written))
+            if not data:
+                break
+            view = memoryview(data)
+            while view:
+                count = os.pwrite(fd, view, offset + written)
+                written += count
+                view = view[count:]
+        return written
+    finally:
+        os.close(fd)
+
+
+def finalize(partial_path, final_path):
+    """Atomically moves a completed upload into place."""
+    os.makedirs(os.path.dirname(final_path), exist_ok=True)
+    os.replace(partial_path, final_path)
+
+
+def discard(partial_path):
+    try:
+        os.remove(partial_path)
+    except FileNotFoundError:
+        pass
+
+
+def sweep_partials(folder, is_live, min_age=60):
+    """
+    Deletes the `.part` files in `folder` whose upload is gone
+    (`is_live(upload_id)` is False), i.e. uploads abandoned until their
+    record expired. Files younger than `min_age` seconds are kept, since
+    their record is written right after the file is created.
+    Returns the number of files removed.
+    """
+    removed = 0
+    cutoff = time.time() - min_age
+    for entry in os.scandir(folder):
+        if not entry.name.endswith(".part") or entry.stat().st_mtime > cutoff:
+            continue
+        if not is_live(entry.name[:-len(".part")]):
+            discard(entry.path)
+            removed += 1
+    return removed
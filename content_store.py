@@ -0,0 +1,45 @@
+"""
+Content-addressed video storage.
+
+Videos are stored as `<sha256>.<ext>`, so identical uploads share one file
+and a client that already knows a file's digest can ask whether the server
+has it before transferring a single byte.
+"""
+import hashlib
+import os
+import re
+
+DIGEST_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+HASH_BUFFER_SIZE = 1024 * 1024
+
+
+def is_valid_digest(digest):
+    return bool(digest) and DIGEST_PATTERN.match(digest) is not None
+
+
+def blob_name(digest, extension):
+    return f"{digest}.{extension.lower()}"
+
+
+def digest_from_name(filename):
+    """Returns the digest if `filename` is a content-addressed blob name, else None."""
+    digest = filename.rsplit(".", 1)[0]
+    return digest if is_valid_digest(digest) else None
+
+
+def find_blob(folder, digest, extensions):
+    """Returns the stored blob name for `digest`, or None if the content is not stored."""
+    for extension in extensions:
+        name = blob_name(digest, extension)
+        if os.path.isfile(os.path.join(folder, name)):
+            return name
+    return None
+
+
+def hash_file(path):
+    """SHA-256 of a file. Blocking: run it through eventlet.tpool on the server."""
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BUFFER_SIZE), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
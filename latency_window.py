@@ -0,0 +1,32 @@
+"""
+Rolling window of latency samples with cheap percentile queries.
+"""
+from collections import deque
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted sequence, or None if it is empty."""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class LatencyWindow:
+    """Keeps the most recent `size` samples (seconds) and answers percentile queries."""
+
+    def __init__(self, size=500, max_sample=5.0):
+        self.samples = deque(maxlen=size)
+        self.max_sample = max_sample
+
+    def add(self, seconds):
+        # Negative samples come from residual clock-offset error; huge ones from
+        # stalled tabs. Neither says anything useful about fan-out latency.
+        if 0.0 <= seconds <= self.max_sample:
+            self.samples.append(seconds)
+
+    def __len__(self):
+        return len(self.samples)
+
+    def percentile(self, pct):
+        return percentile(sorted(self.samples), pct)
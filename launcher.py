@@ -0,0 +1,190 @@
+# IMPORTANT: Eventlet monkey patching must happen *before* any other imports
+import eventlet
+eventlet.monkey_patch()
+
+import argparse
+import itertools
+import os
+import re
+import signal
+import socket
+import subprocess
+import sys
+
+from structured_log import log
+from redis_config import check_connection, initialize_redis_state, clear_all_rooms
+
+# --- Multi-Worker Launcher ---
+# Runs N independent server.py worker processes (one per core) on consecutive
+# ports and a small sticky TCP proxy in front of them:
+#
+#   * New Engine.IO sessions (no `sid` yet) are spread round-robin over workers.
+#   * Follow-up polling / upgrade requests carry `sid=w<id>-...` (see server.py)
+#     and are routed back to the worker that owns that session.
+#   * The worker is picked per connection, so every plain HTTP request is sent
+#     with `Connection: close`: the browser opens a new connection (and gets
+#     a fresh pick) for its next request instead of reusing this one for
+#     another worker's session. WebSocket upgrades keep their connection.
+#
+# Cross-worker emits use Flask-SocketIO's Redis message queue, and every
+# worker's Redis listener fans sync events out to its own sockets only.
+#
+# Behind a real load balancer, run with --no-proxy and configure stickiness
+# there instead (e.g. nginx `ip_hash` or `hash $arg_sid`) over the worker ports.
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server.py')
+SESSION_WORKER_PATTERN = re.compile(rb'[?&]sid=w(\d+)-')
+PROXY_BUFFER_SIZE = 64 * 1024
+MAX_REQUEST_HEAD = 64 * 1024
+CONNECTION_HEADERS = (b"connection:", b"keep-alive:")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run several EchoStream workers behind a sticky proxy.")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="Number of worker processes (default: number of CPUs)")
+    parser.add_argument('--host', default='0.0.0.0', help="Address the proxy listens on")
+    parser.add_argument('--port', type=int, default=5000, help="Port the proxy listens on")
+    parser.add_argument('--worker-host', default='127.0.0.1', help="Address the workers listen on")
+    parser.add_argument('--worker-base-port', type=int, default=5001,
+                        help="Worker i listens on worker-base-port + i")
+    parser.add_argument('--no-proxy', action='store_true',
+                        help="Only start the workers; stickiness is handled by an external load balancer")
+    return parser.parse_args()
+
+
+def start_workers(count, host, base_port):
+    workers = []
+    for worker_id in range(count):
+        env = dict(os.environ)
+        env["ECHOSTREAM_WORKER_ID"] = str(worker_id)
+        env["ECHOSTREAM_HOST"] = host
+        env["ECHOSTREAM_PORT"] = str(base_port + worker_id)
+        workers.append(subprocess.Popen([sys.executable, SERVER_SCRIPT], env=env))
+    return workers
+
+
+def stop_workers(workers):
+    for proc in workers:
+        if proc.poll() is None:
+            proc.terminate()
+    for proc in workers:
+        try:
+            proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+# --- Sticky Proxy ---
+
+def read_request_head(client):
+    """Reads from the client until the HTTP request headers are complete."""
+    head = b""
+    while b"\r\n\r\n" not in head and len(head) < MAX_REQUEST_HEAD:
+        chunk = client.recv(PROXY_BUFFER_SIZE)
+        if not chunk:
+            break
+        head += chunk
+    return head
+
+
+def close_after_response(head):
+    """
+    Rewrites the request so the worker closes the connection after
+    answering it. WebSocket upgrades (and heads too large to parse) are left
+    alone.
+    """
+    headers, separator, body = head.partition(b"\r\n\r\n")
+    if not separator:
+        return head
+    lines = headers.split(b"\r\n")
+    if any(line.lower().startswith(b"upgrade:") for line in lines[1:]):
+        return head
+    kept = [line for line in lines[1:] if not line.lower().startswith(CONNECTION_HEADERS)]
+    return b"\r\n".join([lines[0]] + kept + [b"Connection: close"]) + separator + body
+
+
+def pick_backend(head, backends, round_robin):
+    request_line = head.split(b"\r\n", 1)[0]
+    match = SESSION_WORKER_PATTERN.search(request_line)
+    if match and int(match.group(1)) < len(backends):
+        return backends[int(match.group(1))]
+    return backends[next(round_robin) % len(backends)]
+
+
+def pipe(source, destination):
+    try:
+        while True:
+            data = source.recv(PROXY_BUFFER_SIZE)
+            if not data:
+                break
+            destination.sendall(data)
+    except OSError:
+        pass
+    finally:
+        try:
+            destination.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+
+
+def handle_client(client, backends, round_robin):
+    upstream = None
+    try:
+        head = read_request_head(client)
+        if not head:
+            return
+        upstream = eventlet.connect(pick_backend(head, backends, round_robin))
+        upstream.sendall(close_after_response(head))
+        eventlet.spawn_n(pipe, client, upstream)
+        pipe(upstream, client)
+    except OSError as e:
+        log.warning("proxy_error", "Proxy connection error", error=e)
+    finally:
+        client.close()
+        if upstream is not None:
+            upstream.close()
+
+
+def run_proxy(host, port, backends):
+    listener = eventlet.listen((host, port), backlog=1024)
+    round_robin = itertools.count()
+    log.info("startup", f"🔀 Sticky proxy listening on http://{host}:{port} -> {len(backends)} workers")
+    pool = eventlet.GreenPool(100000)
+    while True:
+        client, _ = listener.accept()
+        client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        pool.spawn_n(handle_client, client, backends, round_robin)
+
+
+def main():
+    args = parse_args()
+    count = max(1, args.workers)
+
+    # Wipe shared state once, before any worker starts. Workers share it
+    # through Redis, so the in-memory state backend can't be used here.
+    check_connection()
+    initialize_redis_state()
+
+    workers = start_workers(count, args.worker_host, args.worker_base_port)
+    last_port = args.worker_base_port + count - 1
+    log.info("startup", f"🚀 Started {count} workers on ports {args.worker_base_port}-{last_port}")
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    try:
+        if args.no_proxy:
+            while all(proc.poll() is None for proc in workers):
+                eventlet.sleep(1)
+            log.error("worker_exited", "❌ A worker exited. Shutting down...")
+        else:
+            backends = [(args.worker_host, args.worker_base_port + i) for i in range(count)]
+            run_proxy(args.host, args.port, backends)
+    except KeyboardInterrupt:
+        log.info("shutdown", "Shutting down...")
+    finally:
+        stop_workers(workers)
+        clear_all_rooms()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,288 @@
+"""
+In-process state backend: the Redis engine's data model and Lua transitions
+ported to plain dicts, so a single node serves every state read and write
+with zero network hops.
+
+Operations never yield to other greenlets part-way, so each one is atomic
+the way a Lua script is in Redis. The one blocking call, read_events, waits
+on a Condition (green once eventlet has patched threading) that every
+append notifies. State is lost on restart and not shared between
+processes, so launcher.py's multi-worker mode needs the Redis backend.
+"""
+import json
+import threading
+import time
+from collections import deque
+
+import wire
+from state_backend import StateBackend
+from sync_config import EVENT_STREAM_MAXLEN, CONTROLLER_LEASE_TTL
+
+DEFAULT_STATE = {
+    "video_file_url": "",
+    "is_playing": "0",
+    "current_time": "0.0",
+    "last_update_timestamp": "0.0",
+    "controller_sid": "",     # Empty string means no controller
+    "controller_token": "0",  # Fencing token of the current controller
+    "version": "0",
+}
+
+
+def _entry_key(entry_id):
+    ms, _, seq = entry_id.partition("-")
+    return int(ms), int(seq or 0)
+
+
+class MemoryBackend(StateBackend):
+
+    def __init__(self, maxlen=EVENT_STREAM_MAXLEN, lease_ttl=CONTROLLER_LEASE_TTL, clock=time.time):
+        self.maxlen = maxlen
+        self.lease_ttl = lease_ttl
+        self.clock = clock   # Lease expiry, stream ids and upload TTLs; the sync simulator passes a virtual one
+        self.states = {}     # room -> state hash
+        self.rooms = set()   # active rooms (ROOMS_KEY)
+        self.presence = {}   # room -> {member: last seen}
+        self.leases = {}     # room -> (holder, expires at)
+        self.streams = {}    # room -> deque of (entry id, fields)
+        self.last_entry = (0, 0)
+        self.uploads = {}    # upload id -> [fields, received chunk indexes, expires at]
+        self.appended = threading.Condition()
+
+    # --- Lifecycle ---
+
+    def initialize(self):
+        self.clear()
+
+    def clear(self):
+        self.states.clear()
+        self.rooms.clear()
+        self.presence.clear()
+        self.leases.clear()
+        self.streams.clear()
+        self.uploads.clear()
+
+    # --- Helpers ---
+
+    def _room_state(self, room):
+        state = self.states.get(room)
+        if state is None:
+            state = self.states[room] = dict(DEFAULT_STATE)
+        return state
+
+    @staticmethod
+    def _incr(state, field):
+        value = int(state.get(field, 0)) + 1
+        state[field] = str(value)
+        return value
+
+    def _lease_holder(self, room):
+        lease = self.leases.get(room)
+        if lease is None:
+            return None
+        if lease[1] <= self.clock():
+            del self.leases[room]
+            return None
+        return lease[0]
+
+    def _next_entry_id(self):
+        # Same shape as Redis stream ids: strictly increasing "<ms>-<seq>"
+        ms = int(self.clock() * 1000)
+        last_ms, last_seq = self.last_entry
+        self.last_entry = (ms, 0) if ms > last_ms else (last_ms, last_seq + 1)
+        return "%d-%d" % self.last_entry
+
+    def _append(self, room, event, version, payload_field, payload, trace=""):
+        fields = {b'event': event.encode(), b'version': str(version).encode(), payload_field: payload}
+        if trace:
+            fields[b'trace'] = trace.encode()
+        stream = self.streams.get(room)
+        if stream is None:
+            stream = self.streams[room] = deque(maxlen=self.maxlen)
+        stream.append((self._next_entry_id(), fields))
+        with self.appended:
+            self.appended.notify_all()
+
+    # --- Room State ---
+
+    def get_state(self, room):
+        return dict(self.states.get(room, {}))
+
+    def join(self, room, member, now):
+        state = self._room_state(room)
+        self.rooms.add(room)
+        self.presence.setdefault(room, {})[member] = now
+        stream = self.streams.get(room)
+        return dict(state), stream[-1][0] if stream else "0-0"
+
+    # --- Transitions ---
+
+    def control_transition(self, room, member, token, event_name, media_time, effective_at, playing_flag,
+                           issued_at, trace=""):
+        state = self.states.get(room)
+        if (state is None or self._lease_holder(room) != member
+                or state.get("controller_sid") != member or state.get("controller_token") != token):
+            return 0
+        if playing_flag:
+            state["is_playing"] = playing_flag
+        if playing_flag == "1":
+            state["play_at"] = str(effective_at)
+        state["current_time"] = str(media_time)
+        state["last_update_timestamp"] = str(effective_at)
+        version = self._incr(state, "version")
+        packed = wire.encode(event_name, float(media_time), float(effective_at), state["is_playing"] == "1",
+                             version, float(issued_at))
+        self._append(room, event_name, version, b'wire', packed, trace)
+        return version
+
+    def load_video(self, room, url, uploader, now):
+        state = self._room_state(room)
+        state.update({
+            "video_file_url": url,
+            "controller_sid": uploader,
+            "is_playing": "0",
+            "current_time": "0.0",
+            "last_update_timestamp": str(now),
+        })
+        self.leases[room] = (uploader, self.clock() + self.lease_ttl)
+        token = self._incr(state, "controller_token")
+        version = self._incr(state, "version")
+        self._append(room, "video_loaded", version, b'data', json.dumps({
+            "url": url, "sid": uploader, "controller_sid": uploader, "token": token,
+            "time": 0, "updated_at": now, "playing": False, "version": version
+        }).encode())
+        return version
+
+    # --- Presence ---
+
+    def touch(self, room, member, now):
+        self.presence.setdefault(room, {})[member] = now
+
+    def heartbeat(self, rooms, now):
+        for room, members, controller in rooms:
+            self.rooms.add(room)
+            present = self.presence.setdefault(room, {})
+            for member in members:
+                present[member] = now
+            if controller and self._lease_holder(room) == controller:
+                self.leases[room] = (controller, self.clock() + self.lease_ttl)
+
+    def _elect(self, room, leaving, cutoff, left_at):
+        # Port of ELECT_CONTROLLER_LUA; see redis_scripts.py for the rules
+        state = self.states.get(room)
+        present = self.presence.setdefault(room, {})
+        if cutoff is not None:
+            for member in [member for member, seen in present.items() if seen <= cutoff]:
+                del present[member]
+        current = state.get("controller_sid", "") if state else ""
+        holder = self._lease_holder(room)
+        if leaving:
+            seen = present.get(leaving)
+            if seen is not None and seen > left_at:
+                return 0
+            present.pop(leaving, None)
+            if current != leaving or (holder and holder != leaving):
+                return 0
+        elif current == "" or (holder and current in present):
+            if current == "" and not present:
+                self.rooms.discard(room)
+                self.presence.pop(room, None)
+            return 0
+        controller = max(present, key=present.get) if present else ""
+        if controller:
+            self.leases[room] = (controller, self.clock() + self.lease_ttl)
+        else:
+            self.leases.pop(room, None)
+        state = self._room_state(room)
+        token = self._incr(state, "controller_token")
+        state["controller_sid"] = controller
+        version = self._incr(state, "version")
+        self._append(room, "controller_change", version, b'data', json.dumps({
+            "controller_sid": controller, "token": token, "version": version
+        }).encode())
+        return version
+
+    def remove_member(self, room, member, left_at):
+        return self._elect(room, member, None, left_at)
+
+    def reap(self, owner, cutoff):
+        # A single process is always the only reaper. Expired uploads go too,
+        # as Redis would expire them without anyone reading them again.
+        now = self.clock()
+        for upload_id in [upload_id for upload_id, upload in self.uploads.items() if upload[2] <= now]:
+            del self.uploads[upload_id]
+        return [(room, self._elect(room, "", cutoff, None)) for room in list(self.rooms)]
+
+    # --- Events ---
+
+    def _entries_after(self, room, last_id, count):
+        stream = self.streams.get(room)
+        if not stream or _entry_key(stream[-1][0]) <= _entry_key(last_id):
+            return []
+        last = _entry_key(last_id)
+        newer = [entry for entry in reversed(stream) if _entry_key(entry[0]) > last]
+        newer.reverse()
+        return newer[:count]
+
+    def read_events(self, positions, count, block):
+        deadline = time.monotonic() + block
+        while True:
+            batch = [(room, entries) for room, entries in
+                     ((room, self._entries_after(room, last_id, count)) for room, last_id in positions.items())
+                     if entries]
+            remaining = deadline - time.monotonic()
+            if batch or remaining <= 0:
+                return batch
+            with self.appended:
+                self.appended.wait(remaining)
+
+    def events_before(self, room, before, count):
+        stream = self.streams.get(room) or ()
+        limit = _entry_key(before) if before else None
+        page = []
+        for entry in reversed(stream):
+            if limit is not None and _entry_key(entry[0]) >= limit:
+                continue
+            page.append(entry)
+            if len(page) == count:
+                break
+        return page
+
+    # --- Uploads ---
+
+    def _upload(self, upload_id):
+        upload = self.uploads.get(upload_id)
+        if upload is not None and upload[2] <= self.clock():
+            del self.uploads[upload_id]
+            return None
+        return upload
+
+    def create_upload(self, upload_id, fields, ttl):
+        self.uploads[upload_id] = [{key: str(value) for key, value in fields.items()}, set(), self.clock() + ttl]
+
+    def get_upload(self, upload_id):
+        upload = self._upload(upload_id)
+        return dict(upload[0]) if upload else {}
+
+    def first_missing_chunk(self, upload_id):
+        upload = self._upload(upload_id)
+        received = upload[1] if upload else ()
+        index = 0
+        while index in received:
+            index += 1
+        return index
+
+    def mark_chunk(self, upload_id, index, ttl):
+        upload = self._upload(upload_id)
+        if upload is None:
+            return -1
+        fields, received, _ = upload
+        received.add(int(index))
+        upload[2] = self.clock() + ttl
+        if len(received) == int(fields["chunks"]) and "completed" not in fields:
+            fields["completed"] = "1"
+            return 1
+        return 0
+
+    def delete_upload(self, upload_id):
+        self.uploads.pop(upload_id, None)
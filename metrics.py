@@ -0,0 +1,151 @@
+"""
+Minimal Prometheus-style metrics: counters, gauges and histograms rendered
+in the text exposition format for the /metrics endpoint.
+
+Built to stay on at full load. Histogram buckets are fixed when a metric is
+declared, so an observation is one bisect and three additions, and nothing
+is sorted or allocated on the hot path. No locks are taken: the server runs
+every greenlet on one OS thread, and none of these updates can yield
+mid-way, so they are atomic as far as other greenlets are concerned (don't
+record from tpool threads). Gauges of local state are usually read by a
+callback at scrape time, which costs nothing between scrapes.
+"""
+import time
+from bisect import bisect_left
+from functools import wraps
+
+# Default histogram buckets (seconds), from sub-millisecond handlers to slow Redis calls
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        (REGISTRY if registry is None else registry).register(self)
+
+    def samples(self):
+        """(suffix, label values, extra label, value) for every series."""
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, values, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(self.label_names, values, extra)} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    """Monotonic count per label combination: `counter.inc("play")`."""
+    kind = "counter"
+
+    def __init__(self, name, documentation, labels=(), registry=None):
+        super().__init__(name, documentation, labels, registry)
+        self.values = {}
+
+    def inc(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, value in list(self.values.items()):
+            yield "", labels, "", value
+
+
+class Gauge(Metric):
+    """
+    A value that goes up and down. Either set explicitly, or computed at
+    scrape time by `collect`, a callable returning {label values tuple: value}.
+    """
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labels=(), collect=None, registry=None):
+        super().__init__(name, documentation, labels, registry)
+        self.values = {}
+        self.collect = collect
+
+    def set(self, value, *labels):
+        self.values[labels] = value
+
+    def samples(self):
+        values = self.collect() if self.collect else self.values
+        for labels, value in list(values.items()):
+            yield "", labels, "", value
+
+
+class Histogram(Metric):
+    """Distribution over fixed buckets: `histogram.observe(0.003, "play")`."""
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS, registry=None):
+        super().__init__(name, documentation, labels, registry)
+        self.buckets = tuple(sorted(buckets))
+        self.series = {}  # label values -> [per-bucket counts (last one is +Inf), sum]
+
+    def observe(self, value, *labels):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def time(self, *labels):
+        """Decorator recording how long each call takes."""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(time.perf_counter() - start, *labels)
+            return wrapper
+        return decorator
+
+    def samples(self):
+        for labels, (counts, total) in list(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield "_bucket", labels, f'le="{_format_value(float(bound))}"', cumulative
+            yield "_sum", labels, "", total
+            yield "_count", labels, "", cumulative
+
+
+class Registry:
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
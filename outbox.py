@@ -0,0 +1,52 @@
+"""
+Per-connection outbound buffer for slow consumers.
+
+While a viewer's socket is backed up, events for it are parked in an Outbox
+instead of being queued behind everything it hasn't received yet. Playback
+events and state snapshots all carry the complete playback state, so only
+the newest one is kept (latest state wins). Other events (video loads,
+controller changes) go to a small bounded queue; if that overflows the
+client is sent one full `sync_state` instead once it catches up.
+"""
+from collections import deque
+
+import wire
+
+# Events whose payload fully describes the playback state, so a newer one
+# makes any older one obsolete
+COLLAPSIBLE_EVENTS = frozenset(wire.EVENT_CODES) | {"sync_state"}
+
+
+class Outbox:
+
+    def __init__(self, binary, max_events=32):
+        self.binary = binary  # Whether the client negotiated the compact wire encoding
+        self.max_events = max_events
+        self.latest = None    # (event, payload) of the newest state-bearing event
+        self.events = deque()
+        self.overflowed = False
+        self.dropped = 0      # Superseded or overflowing events never sent
+
+    def put(self, event, data, packed=None):
+        payload = packed if self.binary and packed is not None else data
+        if event in COLLAPSIBLE_EVENTS:
+            if self.latest is not None:
+                self.dropped += 1
+            self.latest = (event, payload)
+        elif len(self.events) >= self.max_events:
+            self.overflowed = True
+            self.dropped += 1
+        else:
+            self.events.append((event, payload))
+
+    def drain(self):
+        """
+        The events to send once the client has caught up, oldest first.
+        Empty if the queue overflowed: the caller must send a full sync_state.
+        """
+        if self.overflowed:
+            return []
+        pending = list(self.events)
+        if self.latest is not None:
+            pending.append(self.latest)
+        return pending
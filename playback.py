@@ -0,0 +1,71 @@
+"""
+Server-side playback rules: where a room's media is at a given instant, how
+far ahead to schedule a play, and when a coalesced seek is due.
+
+server.py applies them to live rooms; benchmarks/sync_sim.py drives the same
+functions on a virtual clock, so the simulator measures the server's actual
+behaviour rather than a copy of it.
+"""
+from sync_config import (
+    DEFAULT_PLAY_LEAD, MIN_PLAY_LEAD, MAX_PLAY_LEAD, PLAY_LEAD_MARGIN, MIN_LEAD_SAMPLES,
+    SEEK_COALESCE_WINDOW, SEEK_COALESCE_MAX_DELAY
+)
+
+
+def media_position(state_raw, now):
+    """(media time at server time `now`, whether playing) for a raw state hash."""
+    playing = state_raw.get("is_playing") == "1"
+    position = float(state_raw.get("current_time", 0.0))
+    if playing:
+        # A scheduled play has not started before its start time
+        position += max(0.0, now - float(state_raw.get("last_update_timestamp", 0.0)))
+    return position, playing
+
+
+def tick_fields(state_raw):
+    """The JSON `sync_tick` payload for a raw state hash: media time, the server time it was set at, playing, version."""
+    return {
+        "t": float(state_raw.get("current_time", 0.0)),
+        "u": float(state_raw.get("last_update_timestamp", 0.0)),
+        "p": 1 if state_raw.get("is_playing") == "1" else 0,
+        "v": int(state_raw.get("version", 0)),
+    }
+
+
+def play_lead_time(fanout_latency):
+    """
+    How far in the future to schedule a play so (nearly) every viewer
+    receives it in time, given the LatencyWindow of measured fan-out latency.
+    """
+    p95 = fanout_latency.percentile(95)
+    if p95 is None or len(fanout_latency) < MIN_LEAD_SAMPLES:
+        return DEFAULT_PLAY_LEAD
+    return min(MAX_PLAY_LEAD, max(MIN_PLAY_LEAD, p95 + PLAY_LEAD_MARGIN))
+
+
+class PendingSeek:
+    """The newest seek of a burst, plus the times that decide when to apply it."""
+
+    def __init__(self, sid, token, current_time, received_at, trace=None):
+        self.sid = sid
+        self.token = token
+        self.current_time = current_time
+        self.received_at = received_at
+        self.trace = trace
+        self.first_received_at = received_at
+
+    def update(self, sid, token, current_time, received_at, trace=None):
+        """Replaces the pending seek with a newer one of the same burst."""
+        self.sid = sid
+        self.token = token
+        self.current_time = current_time
+        self.received_at = received_at
+        self.trace = trace
+
+    def due(self):
+        """
+        When to apply the seek: once the burst has been quiet for
+        SEEK_COALESCE_WINDOW, but no later than SEEK_COALESCE_MAX_DELAY after
+        its first seek, so a long scrub still moves the viewers.
+        """
+        return min(self.received_at + SEEK_COALESCE_WINDOW, self.first_received_at + SEEK_COALESCE_MAX_DELAY)
@@ -0,0 +1,174 @@
+"""
+Redis state backend: rooms live in Redis (see redis_config.py for the key
+layout and redis_scripts.py for the atomic transitions), so every worker
+sees the same state and the same event streams.
+"""
+from functools import wraps
+
+import redis
+
+import wire
+from redis_config import (
+    r, r_raw, scripts, ROOMS_KEY, REAPER_LOCK_KEY,
+    state_key, presence_key, controller_lease_key, event_stream_key, room_from_stream,
+    upload_key, upload_chunks_key, ensure_room_state, clear_all_rooms, initialize_redis_state, check_connection
+)
+from state_backend import StateBackend, BackendError
+from sync_config import EVENT_STREAM_MAXLEN, CONTROLLER_LEASE_TTL, PRESENCE_REAP_INTERVAL
+
+
+def redis_errors(method):
+    """Re-raises Redis errors as BackendError, so callers don't depend on the engine."""
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        try:
+            return method(*args, **kwargs)
+        except redis.exceptions.RedisError as e:
+            raise BackendError(str(e)) from e
+    return wrapper
+
+
+def lease_ms():
+    return int(CONTROLLER_LEASE_TTL * 1000)
+
+
+def _decode_entries(entries):
+    return [(entry_id.decode(), fields) for entry_id, fields in entries]
+
+
+class RedisBackend(StateBackend):
+    shared = True
+
+    # --- Lifecycle ---
+
+    def connect(self):
+        check_connection()
+
+    def initialize(self):
+        initialize_redis_state()
+
+    @redis_errors
+    def prepare(self):
+        scripts.load()
+
+    @redis_errors
+    def clear(self):
+        clear_all_rooms()
+
+    # --- Room State ---
+
+    @redis_errors
+    def get_state(self, room):
+        return r.hgetall(state_key(room))
+
+    @redis_errors
+    def get_states(self, rooms):
+        pipe = r.pipeline()
+        for room in rooms:
+            pipe.hgetall(state_key(room))
+        return pipe.execute()
+
+    @redis_errors
+    def join(self, room, member, now):
+        pipe = r.pipeline()
+        ensure_room_state(pipe, room)
+        pipe.zadd(presence_key(room), {member: now})
+        pipe.hgetall(state_key(room))
+        pipe.xrevrange(event_stream_key(room), count=1)
+        state_raw, latest = pipe.execute()[-2:]
+        return state_raw, latest[0][0] if latest else "0-0"
+
+    # --- Transitions ---
+
+    @redis_errors
+    def control_transition(self, room, member, token, event_name, media_time, effective_at, playing_flag,
+                           issued_at, trace=""):
+        return scripts.control_transition(
+            keys=[state_key(room), event_stream_key(room), controller_lease_key(room)],
+            args=[member, event_name, media_time, effective_at, playing_flag, EVENT_STREAM_MAXLEN, issued_at,
+                  wire.PACK_FORMAT_LUA, wire.EVENT_CODES[event_name], token, trace]
+        )
+
+    @redis_errors
+    def load_video(self, room, url, uploader, now):
+        return scripts.load_video(
+            keys=[state_key(room), event_stream_key(room), controller_lease_key(room)],
+            args=[url, uploader, now, EVENT_STREAM_MAXLEN, lease_ms()]
+        )
+
+    # --- Presence ---
+
+    @redis_errors
+    def touch(self, room, member, now):
+        r.zadd(presence_key(room), {member: now})
+
+    @redis_errors
+    def heartbeat(self, rooms, now):
+        # One pipeline for every room's ZADD and lease renewal
+        pipe = r.pipeline(transaction=False)
+        for room, members, controller in rooms:
+            # Re-registers a room the reaper dropped while its members looked stale
+            pipe.sadd(ROOMS_KEY, room)
+            pipe.zadd(presence_key(room), {member: now for member in members})
+            if controller:
+                scripts.renew_lease(keys=[controller_lease_key(room)], args=[controller, lease_ms()], client=pipe)
+        pipe.execute()
+
+    def _elect(self, room, member, cutoff, left_at, client=None):
+        return scripts.elect_controller(
+            keys=[presence_key(room), state_key(room), event_stream_key(room), controller_lease_key(room), ROOMS_KEY],
+            args=[member, cutoff, EVENT_STREAM_MAXLEN, lease_ms(), left_at, room],
+            client=client
+        )
+
+    @redis_errors
+    def remove_member(self, room, member, left_at):
+        return self._elect(room, member, "", left_at)
+
+    @redis_errors
+    def reap(self, owner, cutoff):
+        if not r.set(REAPER_LOCK_KEY, owner, nx=True, px=int(PRESENCE_REAP_INTERVAL * 1000)):
+            return None
+        rooms = list(r.smembers(ROOMS_KEY))
+        pipe = r.pipeline(transaction=False)
+        for room in rooms:
+            self._elect(room, "", cutoff, "", client=pipe)
+        return list(zip(rooms, pipe.execute()))
+
+    # --- Events ---
+
+    @redis_errors
+    def read_events(self, positions, count, block):
+        streams = {event_stream_key(room): last_id for room, last_id in positions.items()}
+        batch = r_raw.xread(streams, count=count, block=int(block * 1000)) or []
+        return [(room_from_stream(stream.decode()), _decode_entries(entries)) for stream, entries in batch]
+
+    @redis_errors
+    def events_before(self, room, before, count):
+        end = f"({before}" if before else "+"
+        return _decode_entries(r_raw.xrevrange(event_stream_key(room), max=end, count=count))
+
+    # --- Uploads ---
+
+    @redis_errors
+    def create_upload(self, upload_id, fields, ttl):
+        pipe = r.pipeline()
+        pipe.hset(upload_key(upload_id), mapping=fields)
+        pipe.expire(upload_key(upload_id), ttl)
+        pipe.execute()
+
+    @redis_errors
+    def get_upload(self, upload_id):
+        return r.hgetall(upload_key(upload_id))
+
+    @redis_errors
+    def first_missing_chunk(self, upload_id):
+        return r.bitpos(upload_chunks_key(upload_id), 0)
+
+    @redis_errors
+    def mark_chunk(self, upload_id, index, ttl):
+        return scripts.upload_chunk(keys=[upload_key(upload_id), upload_chunks_key(upload_id)], args=[index, ttl])
+
+    @redis_errors
+    def delete_upload(self, upload_id):
+        r.delete(upload_key(upload_id), upload_chunks_key(upload_id))
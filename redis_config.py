@@ -65,28 +65,106 @@
 
 
 
+import time
 import redis
 import json
 
+from redis_scripts import SyncScripts
+from metrics import Counter, Histogram
+from sync_config import REDIS_URL
+
 # --- Configuration ---
+
 # Use a connection pool for high-performance, concurrent Redis connections
-REDIS_POOL = redis.ConnectionPool(host='localhost', port=6379, db=0, decode_responses=True)
+REDIS_POOL = redis.ConnectionPool.from_url(REDIS_URL, decode_responses=True)
+# Event streams carry packed binary payloads, so they are read without decoding
+REDIS_RAW_POOL = redis.ConnectionPool.from_url(REDIS_URL)
 
 # --- Constants ---
-STATE_KEY = "vidsync:state"
-USER_SET_KEY = "vidsync:users"
-SYNC_CHANNEL = "vidsync:events"  # <--- NEW: Dedicated channel for real-time sync
+# Every watch party ("room") gets its own state hash, presence sorted set and
+# event stream, so rooms never see each other's traffic.
+KEY_PREFIX = "vidsync"
+ROOMS_KEY = f"{KEY_PREFIX}:rooms"  # Set of active rooms; idle ones are dropped by the reaper
+REAPER_LOCK_KEY = f"{KEY_PREFIX}:presence-reaper"  # Held by the node reaping this round
+
+def state_key(room):
+    return f"{KEY_PREFIX}:state:{room}"
+
+def controller_lease_key(room):
+    # Holds the controller's sid while its lease is valid
+    return f"{KEY_PREFIX}:controller-lease:{room}"
+
+def presence_key(room):
+    # Sorted set of member sids scored by their last heartbeat
+    return f"{KEY_PREFIX}:presence:{room}"
+
+def event_stream_key(room):
+    return f"{KEY_PREFIX}:events:{room}"
+
+def room_from_stream(stream):
+    return stream.split(":", 2)[2]
+
+def upload_key(upload_id):
+    return f"{KEY_PREFIX}:upload:{upload_id}"
+
+def upload_chunks_key(upload_id):
+    return f"{KEY_PREFIX}:upload:{upload_id}:chunks"
+
+# --- Instrumentation ---
+REDIS_COMMAND_SECONDS = Histogram(
+    "echostream_redis_command_seconds",
+    "Redis round trip time per command (a pipeline counts as one PIPELINE round trip; XREAD includes its block time)",
+    labels=("command",)
+)
+REDIS_ERRORS = Counter("echostream_redis_errors_total", "Redis commands that raised an error", labels=("command",))
+
+class InstrumentedPipeline(redis.client.Pipeline):
+
+    def execute(self, raise_on_error=True):
+        start = time.perf_counter()
+        try:
+            return super().execute(raise_on_error)
+        except redis.exceptions.RedisError:
+            REDIS_ERRORS.inc("PIPELINE")
+            raise
+        finally:
+            REDIS_COMMAND_SECONDS.observe(time.perf_counter() - start, "PIPELINE")
+
+class InstrumentedRedis(redis.Redis):
+    """Records the latency and errors of every command it sends."""
+
+    def execute_command(self, *args, **options):
+        command = str(args[0]).split(" ", 1)[0].upper()
+        start = time.perf_counter()
+        try:
+            return super().execute_command(*args, **options)
+        except redis.exceptions.RedisError:
+            REDIS_ERRORS.inc(command)
+            raise
+        finally:
+            REDIS_COMMAND_SECONDS.observe(time.perf_counter() - start, command)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
 
 # --- Redis Client Instance ---
-try:
-    r = redis.Redis(connection_pool=REDIS_POOL)
-    r.ping()
-    print("✅ Successfully connected to Redis server.")
-except redis.exceptions.ConnectionError as e:
-    print(f"❌ CRITICAL: Could not connect to Redis.")
-    print("Please ensure the Redis server is running on localhost:6379.")
-    print(f"Error: {e}")
-    exit(1)
+# Connections are opened on first use, so importing this module never
+# touches the network; call check_connection() to fail fast at startup.
+r = InstrumentedRedis(connection_pool=REDIS_POOL)
+r_raw = InstrumentedRedis(connection_pool=REDIS_RAW_POOL)
+
+def check_connection():
+    try:
+        r.ping()
+        print("✅ Successfully connected to Redis server.")
+    except redis.exceptions.ConnectionError as e:
+        print(f"❌ CRITICAL: Could not connect to Redis.")
+        print(f"Please ensure the Redis server is running at {REDIS_URL}.")
+        print(f"Error: {e}")
+        exit(1)
+
+# Atomic state-transition scripts, invoked by SHA
+scripts = SyncScripts(r)
 
 # --- Helper Utilities ---
 
@@ -106,27 +184,39 @@ def get_json(key):
         print(f"Redis get_json error: {e}")
         return None
 
+def clear_all_rooms():
+    """Deletes the state hash, presence, lease and event stream of every room."""
+    # Scanned rather than read from ROOMS_KEY, which only lists active rooms
+    pipe = r.pipeline()
+    for key_of in (state_key, presence_key, controller_lease_key, event_stream_key):
+        for key in r.scan_iter(match=key_of("*"), count=500):
+            pipe.delete(key)
+    pipe.delete(ROOMS_KEY)
+    pipe.execute()
+
 def initialize_redis_state():
-    """Wipes and sets the default state in Redis on server start."""
+    """Wipes every room on server start. Room state is created lazily on first join."""
     print("🔄 Initializing Redis state...")
     try:
-        # Use a pipeline for atomic initialization
-        pipe = r.pipeline()
-        
         # Clear previous state
-        pipe.delete(STATE_KEY)
-        pipe.delete(USER_SET_KEY)
-        
-        # Set default video state
-        pipe.hset(STATE_KEY, mapping={
-            "video_file_url": "",
-            "is_playing": "0",
-            "current_time": "0.0",
-            "last_update_timestamp": "0.0",
-            "controller_sid": "" # Empty string means no controller
-        })
-        
-        pipe.execute()
+        clear_all_rooms()
+
+        # Load the Lua scripts once so control events can use EVALSHA
+        scripts.load()
         print("Redis state initialized.")
     except redis.exceptions.RedisError as e:
-        print(f"❌ Failed to initialize Redis state: {e}")
\ No newline at end of file
+        print(f"❌ Failed to initialize Redis state: {e}")
+
+def ensure_room_state(pipe, room):
+    """
+    Queues commands on `pipe` that register a room and create its default
+    state if it does not exist yet, so callers can batch it with their own reads.
+    """
+    pipe.sadd(ROOMS_KEY, room)
+    pipe.hsetnx(state_key(room), "video_file_url", "")
+    pipe.hsetnx(state_key(room), "is_playing", "0")
+    pipe.hsetnx(state_key(room), "current_time", "0.0")
+    pipe.hsetnx(state_key(room), "last_update_timestamp", "0.0")
+    pipe.hsetnx(state_key(room), "controller_sid", "")  # Empty string means no controller
+    pipe.hsetnx(state_key(room), "controller_token", "0")  # Fencing token of the current controller
+    pipe.hsetnx(state_key(room), "version", "0")
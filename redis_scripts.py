@@ -0,0 +1,227 @@
+"""
+Server-side Lua scripts for atomic state transitions.
+
+Every script is loaded into Redis's script cache once at startup and then
+invoked by SHA (EVALSHA), so a control event costs a single round trip and
+the controller check, the state write and the event append can never
+interleave with another client's command.
+
+Every script that mutates a room's state bumps its `version` field in the
+same call and appends the resulting event, stamped with that version, to the
+room's capped event stream (XADD MAXLEN ~). Versions are strictly increasing
+per room, so clients can order (and de-duplicate) what they see, and the
+stream doubles as a replay log for listeners and clients that fell behind.
+
+The controller role is a lease (a key holding the controller's sid, set with
+PX and renewed by the node the controller is connected to) plus a fencing
+token, `controller_token` in the state hash, that grows with every hand-over.
+Control transitions must present both the sid holding the lease and the
+current token, so a stale controller is rejected inside the same EVALSHA.
+Stream entries have the fields `event`, `version` and either `wire` (playback
+events, packed as described in wire.py) or `data` (everything else, JSON),
+plus `trace` (the trace context, see tracing.py) on sampled control events.
+"""
+
+# Shared helper prepended to the scripts below: appends an event (and its
+# trace context, if any) to a room's stream, capped at about `maxlen` entries
+APPEND_EVENT_LUA = """
+local function append_event(stream, maxlen, event, version, payload_field, payload, trace)
+    if trace and trace ~= '' then
+        redis.call('XADD', stream, 'MAXLEN', '~', maxlen, '*',
+            'event', event, 'version', version, payload_field, payload, 'trace', trace)
+    else
+        redis.call('XADD', stream, 'MAXLEN', '~', maxlen, '*',
+            'event', event, 'version', version, payload_field, payload)
+    end
+end
+"""
+
+# --- Control Transition ---
+# KEYS[1] = state hash
+# KEYS[2] = event stream
+# KEYS[3] = controller lease
+# ARGV[1] = sid of the client issuing the command
+# ARGV[2] = event name to publish (sync_play / sync_pause / sync_seek)
+# ARGV[3] = new media time (seconds)
+# ARGV[4] = server timestamp the media time is valid at (a future start time for scheduled plays)
+# ARGV[5] = new is_playing flag ("1" / "0"), or "" to leave it unchanged
+# ARGV[6] = approximate maximum length of the event stream
+# ARGV[7] = server timestamp at which the command was received
+# ARGV[8] = struct.pack format of the compact wire encoding (wire.PACK_FORMAT_LUA)
+# ARGV[9] = wire code of the event
+# ARGV[10] = fencing token presented by the sender
+# ARGV[11] = trace context (JSON), or "" if the command is not traced
+#
+# Returns the new state version, or 0 if the sender is not the controller.
+CONTROL_TRANSITION_LUA = APPEND_EVENT_LUA + """
+if redis.call('GET', KEYS[3]) ~= ARGV[1]
+    or redis.call('HGET', KEYS[1], 'controller_sid') ~= ARGV[1]
+    or redis.call('HGET', KEYS[1], 'controller_token') ~= ARGV[10] then
+    return 0
+end
+if ARGV[5] ~= '' then
+    redis.call('HSET', KEYS[1], 'is_playing', ARGV[5])
+end
+if ARGV[5] == '1' then
+    redis.call('HSET', KEYS[1], 'play_at', ARGV[4])
+end
+redis.call('HSET', KEYS[1], 'current_time', ARGV[3], 'last_update_timestamp', ARGV[4])
+local version = redis.call('HINCRBY', KEYS[1], 'version', 1)
+local flags = 0
+if redis.call('HGET', KEYS[1], 'is_playing') == '1' then
+    flags = 1
+end
+append_event(KEYS[2], ARGV[6], ARGV[2], version, 'wire', struct.pack(ARGV[8],
+    tonumber(ARGV[9]), flags, version, tonumber(ARGV[3]), tonumber(ARGV[4]), tonumber(ARGV[7])), ARGV[11])
+return version
+"""
+
+# --- Video Load ---
+# KEYS[1] = state hash
+# KEYS[2] = event stream
+# KEYS[3] = controller lease
+# ARGV[1] = URL of the new video
+# ARGV[2] = sid of the uploader, who takes over the controller lease
+# ARGV[3] = server timestamp of the load
+# ARGV[4] = approximate maximum length of the event stream
+# ARGV[5] = controller lease duration (milliseconds)
+#
+# Resets playback to a paused start and returns the new state version.
+LOAD_VIDEO_LUA = APPEND_EVENT_LUA + """
+redis.call('HSET', KEYS[1],
+    'video_file_url', ARGV[1],
+    'controller_sid', ARGV[2],
+    'is_playing', '0',
+    'current_time', '0.0',
+    'last_update_timestamp', ARGV[3])
+redis.call('SET', KEYS[3], ARGV[2], 'PX', ARGV[5])
+local token = redis.call('HINCRBY', KEYS[1], 'controller_token', 1)
+local version = redis.call('HINCRBY', KEYS[1], 'version', 1)
+append_event(KEYS[2], ARGV[4], 'video_loaded', version, 'data', cjson.encode({
+    url = ARGV[1],
+    sid = ARGV[2],
+    controller_sid = ARGV[2],
+    token = token,
+    time = 0,
+    updated_at = tonumber(ARGV[3]),
+    playing = false,
+    version = version
+}))
+return version
+"""
+
+# --- Controller Election ---
+# KEYS[1] = presence sorted set (member sid -> last heartbeat timestamp)
+# KEYS[2] = state hash
+# KEYS[3] = event stream
+# KEYS[4] = controller lease
+# KEYS[5] = set of active rooms
+# ARGV[1] = member that left, which is removed from the presence set (and
+#           hands over control if it is the controller); or "" to re-elect
+#           only if the controller's lease expired or it is no longer present
+# ARGV[2] = heartbeat cutoff: members last seen at or before it are evicted
+#           first ("" to skip eviction)
+# ARGV[3] = approximate maximum length of the event stream
+# ARGV[4] = controller lease duration (milliseconds)
+# ARGV[5] = when the member in ARGV[1] left; if it has been seen since (it
+#           reconnected within its grace period) nothing happens
+# ARGV[6] = room name
+#
+# The most recently seen remaining member gets the lease and a new fencing
+# token (nobody gets it if the room is empty). Rooms that never had a
+# controller are left alone. A room with nobody present and no controller
+# leaves the active set, so the reaper stops visiting it (its state is kept
+# and the next join registers it again). Returns the new state version, or 0 if nothing
+# changed, so concurrent elections on different nodes produce one hand-over.
+ELECT_CONTROLLER_LUA = APPEND_EVENT_LUA + """
+if ARGV[2] ~= '' then
+    redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[2])
+end
+local current = redis.call('HGET', KEYS[2], 'controller_sid') or ''
+local holder = redis.call('GET', KEYS[4])
+if ARGV[1] ~= '' then
+    local seen = redis.call('ZSCORE', KEYS[1], ARGV[1])
+    if seen and tonumber(seen) > tonumber(ARGV[5]) then
+        return 0
+    end
+    redis.call('ZREM', KEYS[1], ARGV[1])
+    if current ~= ARGV[1] or (holder and holder ~= ARGV[1]) then
+        return 0
+    end
+elseif current == '' or (holder and redis.call('ZSCORE', KEYS[1], current)) then
+    if current == '' and redis.call('ZCARD', KEYS[1]) == 0 then
+        redis.call('SREM', KEYS[5], ARGV[6])
+    end
+    return 0
+end
+local newest = redis.call('ZREVRANGE', KEYS[1], 0, 0)
+local controller = newest[1] or ''
+if controller ~= '' then
+    redis.call('SET', KEYS[4], controller, 'PX', ARGV[4])
+else
+    redis.call('DEL', KEYS[4])
+end
+-- The token moves on even when nobody takes over, so old tokens stay dead
+local token = redis.call('HINCRBY', KEYS[2], 'controller_token', 1)
+redis.call('HSET', KEYS[2], 'controller_sid', controller)
+local version = redis.call('HINCRBY', KEYS[2], 'version', 1)
+append_event(KEYS[3], ARGV[3], 'controller_change', version, 'data',
+    cjson.encode({controller_sid = controller, token = token, version = version}))
+return version
+"""
+
+# --- Lease Renewal ---
+# KEYS[1] = controller lease
+# ARGV[1] = sid expected to hold the lease
+# ARGV[2] = lease duration (milliseconds)
+#
+# Returns 1 if the lease was extended, 0 if it is held by someone else (or expired).
+RENEW_LEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# --- Upload Chunk Bookkeeping ---
+# KEYS[1] = upload hash (must contain 'chunks', the total chunk count)
+# KEYS[2] = bitmap of received chunks
+# ARGV[1] = index of the chunk that was just written
+# ARGV[2] = TTL (seconds) to refresh on both keys
+#
+# Returns -1 if the upload is unknown, 1 to exactly one caller when this
+# chunk completed the upload, and 0 otherwise.
+UPLOAD_CHUNK_LUA = """
+local chunks = tonumber(redis.call('HGET', KEYS[1], 'chunks'))
+if not chunks then
+    return -1
+end
+redis.call('SETBIT', KEYS[2], ARGV[1], 1)
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+if redis.call('BITCOUNT', KEYS[2]) == chunks and redis.call('HSETNX', KEYS[1], 'completed', '1') == 1 then
+    return 1
+end
+return 0
+"""
+
+
+class SyncScripts:
+    """Holds the registered scripts for one Redis client."""
+
+    def __init__(self, client):
+        self.client = client
+        self.control_transition = client.register_script(CONTROL_TRANSITION_LUA)
+        self.load_video = client.register_script(LOAD_VIDEO_LUA)
+        self.elect_controller = client.register_script(ELECT_CONTROLLER_LUA)
+        self.renew_lease = client.register_script(RENEW_LEASE_LUA)
+        self.upload_chunk = client.register_script(UPLOAD_CHUNK_LUA)
+
+    def all(self):
+        return (self.control_transition, self.load_video, self.elect_controller, self.renew_lease,
+                self.upload_chunk)
+
+    def load(self):
+        """Preloads every script so the first call is already a plain EVALSHA."""
+        for script in self.all():
+            self.client.script_load(script.script)
@@ -0,0 +1,39 @@
+"""
+Signed session resume tokens.
+
+A client's identity in a room (its member id, used for presence and the
+controller role) outlives any single Socket.IO connection. On connect the
+server hands the client a token binding its member id to the room; the
+client presents it when it reconnects and gets the same identity back, on
+whichever worker it lands. Tokens are signed with the app's secret key, so
+they can't be forged to take over someone else's identity.
+"""
+import uuid
+
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+
+class ResumeTokens:
+
+    def __init__(self, secret_key, max_age):
+        self.serializer = URLSafeTimedSerializer(secret_key, salt="echostream-resume")
+        self.max_age = max_age
+
+    @staticmethod
+    def new_member_id():
+        return uuid.uuid4().hex
+
+    def issue(self, member_id, room):
+        return self.serializer.dumps({"m": member_id, "r": room})
+
+    def verify(self, token, room):
+        """The member id in `token` if it is genuine, unexpired and for `room`, else None."""
+        if not isinstance(token, str):
+            return None
+        try:
+            payload = self.serializer.loads(token, max_age=self.max_age)
+        except BadSignature:  # Also covers expired signatures
+            return None
+        if payload.get("r") != room:
+            return None
+        return payload.get("m")
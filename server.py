@@ -1,281 +1,956 @@
 # IMPORTANT: Eventlet monkey patching must happen *before* any other imports
 import eventlet
 eventlet.monkey_patch()
+from eventlet import tpool
 
-import redis
 import os
 import time
 import json
+import re
+import uuid
 import logging
-from flask import Flask, render_template, request, jsonify, url_for, send_from_directory
+from collections import Counter, defaultdict
+from functools import wraps
+from flask import Flask, render_template, request, jsonify, url_for, send_from_directory, abort, Response
 from flask_socketio import SocketIO, emit, join_room, leave_room
 from werkzeug.utils import secure_filename
 
 # Import our Redis client and configuration
-from redis_config import r, STATE_KEY, USER_SET_KEY, SYNC_CHANNEL, initialize_redis_state
+from video_stream import send_video
+from latency_window import LatencyWindow
+from state_cache import StateCache
+from outbox import Outbox
+from resume_tokens import ResumeTokens
+import wire
+import metrics
+import playback
+from structured_log import log
+from tracing import Tracer
+from sync_config import (
+    SYNC_TICK_INTERVAL, EVENT_READ_BLOCK,
+    EVENT_READ_COUNT, SEEK_COALESCE_WINDOW, OUTBOX_HIGH_WATER,
+    OUTBOX_LOW_WATER, OUTBOX_MAX_EVENTS, OUTBOX_CHECK_INTERVAL, PRESENCE_HEARTBEAT_INTERVAL,
+    PRESENCE_TTL, PRESENCE_REAP_INTERVAL, RESUME_GRACE, RESUME_TOKEN_MAX_AGE,
+    TRACE_SAMPLE_RATE, REDIS_URL, DEFAULT_ROOM,
+    client_sync_config
+)
+from content_store import is_valid_digest, blob_name, digest_from_name, find_blob, hash_file
+from chunked_upload import (
+    UPLOAD_CHUNK_SIZE, MAX_UPLOAD_SIZE, UPLOAD_TTL,
+    chunk_count, expected_chunk_length, create_partial, write_chunk, finalize, discard, sweep_partials
+)
+from state_backend import create_backend, BackendError
 
 # --- Constants ---
 UPLOAD_FOLDER = os.path.join('static', 'videos')
+# Kept outside static/ so unfinished uploads are never served. Must be on the
+# same filesystem as UPLOAD_FOLDER so finishing an upload is a rename.
+PARTIAL_UPLOAD_FOLDER = 'partial_uploads'
 ALLOWED_EXTENSIONS = {'mp4', 'webm', 'ogg'}
+ROOM_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+# --- Worker Configuration ---
+# Set by launcher.py when running several worker processes behind the sticky proxy.
+# A standalone `python server.py` runs as a single process with no message queue.
+WORKER_ID = os.environ.get("ECHOSTREAM_WORKER_ID")
+HOST = os.environ.get("ECHOSTREAM_HOST", "0.0.0.0")
+PORT = int(os.environ.get("ECHOSTREAM_PORT", 5000))
+
+# --- State Backend ---
+# Where room state, presence and event streams live (ECHOSTREAM_STATE_BACKEND,
+# see state_backend.py). Workers must share it, so they need Redis.
+backend = create_backend()
+if WORKER_ID is not None and not backend.shared:
+    log.error("backend_error", "❌ CRITICAL: Multi-worker mode needs a shared state backend; "
+              "set ECHOSTREAM_STATE_BACKEND=redis.", worker=WORKER_ID)
+    exit(1)  # The logger flushes its queue at exit
+backend.connect()
 
 # --- App Initialization ---
-print("Starting server with eventlet async mode...")
+log.info("startup", "Starting server with eventlet async mode...")
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['SECRET_KEY'] = 'your-very-secret-key-change-this!' 
-app.config['MAX_CONTENT_LENGTH'] = 1024 * 1024 * 500 
+# Signs resume tokens, so every worker must share it
+app.config['SECRET_KEY'] = os.environ.get('ECHOSTREAM_SECRET_KEY', 'your-very-secret-key-change-this!')
+app.config['MAX_CONTENT_LENGTH'] = UPLOAD_CHUNK_SIZE  # Largest request body is one upload chunk
 
 socketio = SocketIO(
     app,
     async_mode='eventlet',
     cors_allowed_origins="*",
     ping_timeout=10,
-    ping_interval=5
+    ping_interval=5,
+    # In multi-worker mode, emits that target sockets on other workers go through Redis
+    message_queue=REDIS_URL if WORKER_ID is not None else None
+)
+
+if WORKER_ID is not None:
+    # Prefix Engine.IO session ids with the worker id so the launcher's proxy
+    # can route every follow-up polling / upgrade request back to this worker.
+    _generate_eio_id = socketio.server.eio.generate_id
+    socketio.server.eio.generate_id = lambda: f"w{WORKER_ID}-{_generate_eio_id()}"
+
+# Rooms with sockets connected to this process: room -> set of sids.
+# Ticks and broadcasts are only done for rooms that have local members.
+local_rooms = defaultdict(set)
+# Room of every socket connected to this process: sid -> room
+sid_rooms = {}
+# Member id (the identity that survives reconnects) of every local socket: sid -> member id
+sid_members = {}
+# Sockets per member connected to this process (more than one while a reconnect overlaps the old socket)
+local_members = Counter()
+resume_tokens = ResumeTokens(app.config['SECRET_KEY'], RESUME_TOKEN_MAX_AGE)
+# Publish-to-client delivery latency of control events, as measured by viewers
+fanout_latency = LatencyWindow()
+# Read-through cache of the state of rooms with local members, kept current
+# by the events the stream listener already receives
+state_cache = StateCache(backend.get_state)
+# ID of the last event stream entry processed, per locally joined room
+stream_positions = {}
+# Latest not-yet-applied seek per room: room -> PendingSeek
+pending_seeks = {}
+# Clients that negotiated the compact wire encoding
+binary_sids = set()
+# Slow consumers whose events are parked until they catch up: sid -> Outbox
+outboxes = {}
+
+# --- Metrics ---
+# Served at /metrics. Each worker exposes its own, so scrape the worker ports.
+NODE = WORKER_ID or "standalone"
+CONNECTED_SOCKETS = metrics.Gauge(
+    "echostream_connected_sockets", "Sockets connected to this node, per room", labels=("room", "node"),
+    collect=lambda: {(room, NODE): len(sids) for room, sids in list(local_rooms.items())}
 )
+EVENTS_HANDLED = metrics.Counter("echostream_events_handled_total", "Socket.IO events received, per event", labels=("event",))
+EVENTS_BROADCAST = metrics.Counter("echostream_events_broadcast_total", "Room events relayed to local sockets, per event", labels=("event",))
+HANDLER_SECONDS = metrics.Histogram("echostream_handler_seconds", "Socket.IO handler run time", labels=("handler",))
+EVENT_LAG_SECONDS = metrics.Histogram(
+    "echostream_event_lag_seconds", "Time from an event being appended to its room's stream to its local emit"
+)
+LOG_RECORDS_DROPPED = metrics.Gauge(
+    "echostream_log_records_dropped", "Log records dropped since start because the log queue was full",
+    collect=lambda: {(): log.dropped}
+)
+LISTENER_RESTARTS = metrics.Counter("echostream_listener_restarts_total", "Event stream listener restarts after an error")
+UPLOAD_BYTES = metrics.Counter("echostream_upload_bytes_total", "Upload chunk bytes written")
+UPLOAD_SECONDS = metrics.Histogram(
+    "echostream_upload_seconds", "Time from creating an upload to storing the complete file",
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600)
+)
+
+def handled(event, timed=False):
+    """Counts a Socket.IO event and, if `timed`, records its handler's run time."""
+    def decorator(func):
+        if timed:
+            func = HANDLER_SECONDS.time(func.__name__)(func)
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            EVENTS_HANDLED.inc(event)
+            return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def stream_entry_time(entry_id):
+    # Stream entry ids start with the Redis server's clock in milliseconds
+    return int(entry_id.split("-", 1)[0]) / 1000.0
+
+# --- Tracing ---
+# A sampled fraction of control events is traced from the controller's send
+# to every viewer's receipt (see tracing.py)
+tracer = Tracer.from_env(TRACE_SAMPLE_RATE, NODE)
 
 # --- Utility Functions ---
 
+def binary_room(room):
+    # Socket.IO room of the members of `room` that negotiated the compact wire encoding
+    return f"{room}:{wire.BINARY}"
+
+def emit_local(event, data, room, packed=None):
+    """
+    Emits only to the sockets of `room` connected to this process. Every
+    worker's listener already receives every Redis sync event, so relaying
+    through the message queue would deliver each event once per worker.
+    Binary clients get `packed` (the compact wire encoding) when there is one.
+    Slow consumers are skipped; the event goes to their outbox instead.
+    """
+    congested = [sid for sid in outboxes if sid_rooms.get(sid) == room]
+    skip = congested or None
+    socketio.emit(event, data, to=room, skip_sid=skip, ignore_queue=True)
+    socketio.emit(event, data if packed is None else packed, to=binary_room(room), skip_sid=skip, ignore_queue=True)
+    for sid in congested:
+        outboxes[sid].put(event, data, packed)
+
+def emit_to_client(sid, event, data):
+    """Sends a state snapshot or reply-like event to one client, via its outbox if it is congested."""
+    outbox = outboxes.get(sid)
+    if outbox is not None:
+        outbox.put(event, data)
+    else:
+        socketio.emit(event, data, to=sid, ignore_queue=True)
+
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def get_current_state():
+def normalize_room(room):
+    """Returns `room` if it is a valid room id, otherwise the default room."""
+    if room and ROOM_ID_PATTERN.match(room):
+        return room
+    return DEFAULT_ROOM
+
+def parse_state(state_raw):
+    """
+    Turns a raw state hash into the state sent to clients, extrapolating the
+    playback position. `server_time` is the instant `current_time` refers to,
+    so clients with a synced clock can extrapolate it themselves.
+    """
+    state = {k: v for k, v in state_raw.items()}
+    now = time.time()
+    authoritative_time, is_playing = playback.media_position(state_raw, now)
+    state["current_time"] = authoritative_time
+    state["server_time"] = now
+    state["is_playing"] = is_playing
+    state["controller_sid"] = state.get("controller_sid", "")
+    state["video_file_url"] = state.get("video_file_url", "")
+    state["version"] = int(state.get("version", 0))
+    return state
+
+def get_current_state(room):
     try:
-        state_raw = r.hgetall(STATE_KEY)
-        state = {k: v for k, v in state_raw.items()}
-        
-        is_playing = state.get("is_playing") == "1"
-        base_time = float(state.get("current_time", 0.0))
-        last_update = float(state.get("last_update_timestamp", 0.0))
-        
-        authoritative_time = base_time
-        if is_playing:
-            elapsed = time.time() - last_update
-            authoritative_time += elapsed
-            
-        state["current_time"] = authoritative_time
-        state["is_playing"] = is_playing
-        state["controller_sid"] = state.get("controller_sid", "")
-        state["video_file_url"] = state.get("video_file_url", "")
-        return state
-    except redis.exceptions.RedisError as e:
-        print(f"Redis get_current_state error: {e}")
+        return parse_state(state_cache.get(room))
+    except BackendError as e:
+        log.error("backend_error", "get_current_state error", error=e)
         return {}
 
-def elect_new_controller():
+def remove_member(room, member, left_at):
+    """
+    Removes a member that left `room` at `left_at` from its presence set and,
+    if it was the controller, hands control to the most recently seen
+    remaining member (or nobody). Does nothing if the member has been seen
+    since (it reconnected). Returns the new state version if control changed.
+    """
     try:
-        new_controller_sid = r.srandmember(USER_SET_KEY)
-        if new_controller_sid:
-            r.hset(STATE_KEY, "controller_sid", new_controller_sid)
-            print(f"👑 New controller elected: {new_controller_sid}")
-            r.publish(SYNC_CHANNEL, json.dumps({
-                "event": "controller_change",
-                "data": {"controller_sid": new_controller_sid}
-            }))
-        else:
-            r.hset(STATE_KEY, "controller_sid", "")
-            r.publish(SYNC_CHANNEL, json.dumps({
-                "event": "controller_change",
-                "data": {"controller_sid": ""}
-            }))
-        return new_controller_sid
-    except redis.exceptions.RedisError as e:
-        print(f"Redis elect_new_controller error: {e}")
-        return None
-
-def is_controller(sid):
+        version = backend.remove_member(room, member, left_at)
+        if version:
+            log.info("controller_handover", "👑 Control handed over", room=room, member=member, version=version)
+        return version
+    except BackendError as e:
+        log.error("backend_error", "remove_member error", error=e)
+        return 0
+
+def expire_member(room, member, left_at):
+    """Gives a disconnected member RESUME_GRACE seconds to come back before it is removed."""
+    socketio.sleep(RESUME_GRACE)
+    if local_members[member]:
+        return  # Reconnected to this process
+    remove_member(room, member, left_at)
+
+def is_controller(sid, room, token=None):
+    """Whether `sid` is the room's controller (presenting `token`, if given) as far as the cache knows."""
     try:
-        return r.hget(STATE_KEY, "controller_sid") == sid
-    except redis.exceptions.RedisError:
+        state = state_cache.get(room)
+        return state.get("controller_sid") == sid and (token is None or state.get("controller_token") == token)
+    except BackendError:
         return False
 
-# --- Redis Pub/Sub Listener (Robust Version) ---
+def play_lead_time():
+    """How far in the future to schedule a play so (nearly) every viewer receives it in time."""
+    return playback.play_lead_time(fanout_latency)
 
-def redis_event_listener():
+def apply_control_transition(room, sid, token, event_name, current_time, is_playing=None, effective_at=None,
+                             trace=None):
+    """
+    Checks the controller's lease and fencing token, updates the state,
+    bumps the version and appends the sync event in one atomic backend call
+    (a single EVALSHA round trip on Redis). `effective_at` is the server
+    time the media time applies from (defaults to now). `trace` is the
+    command's trace context, if sampled.
+    Returns the new state version, or 0 if the command was rejected.
+    """
+    # Non-controllers and stale tokens are rejected from the local cache without a round trip
+    cached = state_cache.peek(room)
+    if cached is not None and (cached.get("controller_sid") != sid or cached.get("controller_token") != token):
+        return 0
+
+    playing_flag = "" if is_playing is None else ("1" if is_playing else "0")
+    now = time.time()
+    try:
+        version = backend.control_transition(room, sid, token, event_name, current_time, effective_at or now,
+                                             playing_flag, now, Tracer.serialize(trace))
+    except BackendError as e:
+        log.error("backend_error", "Control transition error", error=e)
+        return 0
+    if trace and version:
+        tracer.committed(trace, room, event_name, version)
+    return version
+
+# --- Seek Coalescing ---
+
+def queue_seek(room, sid, token, current_time, trace=None):
+    """
+    Records a seek and applies it once the burst is over, so a scrub through
+    the timeline costs one state update and one broadcast instead of one per
+    intermediate position. The media time stays valid from when the seek
+    was received, so applying it late doesn't shift playback.
+    """
+    now = time.time()
+    pending = pending_seeks.get(room)
+    if pending is not None:
+        pending.update(sid, token, current_time, now, trace)
+        return
+    pending_seeks[room] = playback.PendingSeek(sid, token, current_time, now, trace)
+    socketio.start_background_task(flush_seek, room)
+
+def flush_seek(room):
+    pending = pending_seeks.get(room)
+    while pending is not None and pending_seeks.get(room) is pending:
+        delay = pending.due() - time.time()
+        if delay <= 0:
+            del pending_seeks[room]
+            if apply_control_transition(room, pending.sid, pending.token, "sync_seek", pending.current_time,
+                                        effective_at=pending.received_at, trace=pending.trace):
+                log.info("seek", "⏩ Controller SEEK", room=room, member=pending.sid, time=pending.current_time)
+            return
+        socketio.sleep(delay)
+
+def drop_pending_seek(room, sid):
+    # A play or pause from the seeking controller carries its own position,
+    # which supersedes its queued seek
+    pending = pending_seeks.get(room)
+    if pending is not None and pending.sid == sid:
+        del pending_seeks[room]
+
+# --- Presence ---
+
+def presence_heartbeat():
     """
-    Listens to the Redis SYNC_CHANNEL.
-    Includes auto-restart logic to ensure the sync never dies.
+    Refreshes the last-seen score of every member connected to this process
+    and renews the lease of every controller connected to it, all in one
+    batched backend call (a single pipeline on Redis) per interval. If the
+    process dies its members and leases simply stop being refreshed and the
+    reaper takes over.
     """
-    print("🎧 Redis Pub/Sub Listener started. Waiting for events...")
+    log.info("task_started", "💓 Presence heartbeat started.")
     while True:
+        socketio.sleep(PRESENCE_HEARTBEAT_INTERVAL)
+        rooms = [(room, list(sids)) for room, sids in local_rooms.items() if sids]
+        if not rooms:
+            continue
         try:
-            pubsub = r.pubsub(ignore_subscribe_messages=True)
-            pubsub.subscribe(SYNC_CHANNEL)
-            
-            for message in pubsub.listen():
-                if message['type'] == 'message':
-                    payload = json.loads(message['data'])
-                    event_name = payload.get('event')
-                    event_data = payload.get('data')
-                    
-                    print(f"📣 Broadcasting event: {event_name}")
-                    socketio.emit(event_name, event_data)
+            batch = []
+            for room, sids in rooms:
+                members = {sid_members.get(sid, sid) for sid in sids}
+                controller_sid = state_cache.get(room).get("controller_sid")
+                batch.append((room, members, controller_sid if controller_sid in members else None))
+            backend.heartbeat(batch, time.time())
         except Exception as e:
-            print(f"❌ Redis Listener Error: {e}. Restarting in 2 seconds...")
+            log.error("task_error", "❌ Presence Heartbeat Error", error=e)
+
+def presence_reaper():
+    """
+    Evicts members whose heartbeat is older than PRESENCE_TTL from every
+    room and re-elects the controller of any room whose controller was among
+    them or whose lease expired (one script call per room on Redis). Only
+    the node that wins the reaper lock for a round does the work.
+    """
+    log.info("task_started", "🪦 Presence reaper started.")
+    while True:
+        socketio.sleep(PRESENCE_REAP_INTERVAL)
+        # Partial uploads live on this node's disk, so every node sweeps its own
+        sweep_partial_uploads()
+        try:
+            results = backend.reap(NODE, time.time() - PRESENCE_TTL)
+            for room, version in results or ():
+                if version:
+                    log.info("controller_reelected", "👑 Controller timed out; re-elected", room=room, version=version)
+        except Exception as e:
+            log.error("task_error", "❌ Presence Reaper Error", error=e)
+
+# --- Slow Consumers ---
+
+def outbound_backlog(sid):
+    """Packets Engine.IO has queued for `sid` that haven't been written to its socket yet."""
+    try:
+        eio_sid = socketio.server.manager.eio_sid_from_sid(sid, '/')
+        return socketio.server.eio.sockets[eio_sid].queue.qsize()
+    except (KeyError, AttributeError):
+        return 0
+
+def outbound_monitor():
+    """
+    Parks the events of clients whose outbound queue keeps growing (slow
+    links) and, once they have caught up, sends them only what is still
+    current. Their backlog stops growing and other clients never wait for them.
+    """
+    log.info("task_started", "🐢 Outbound queue monitor started.")
+    while True:
+        socketio.sleep(OUTBOX_CHECK_INTERVAL)
+        try:
+            for sid in list(sid_rooms):
+                backlog = outbound_backlog(sid)
+                outbox = outboxes.get(sid)
+                if outbox is None:
+                    if backlog > OUTBOX_HIGH_WATER:
+                        log.warning("slow_consumer", "🐢 Client is falling behind; parking its events", sid=sid, backlog=backlog)
+                        outboxes[sid] = Outbox(sid in binary_sids, OUTBOX_MAX_EVENTS)
+                elif backlog <= OUTBOX_LOW_WATER:
+                    del outboxes[sid]
+                    pending = outbox.drain()
+                    if outbox.overflowed:
+                        socketio.emit('sync_state', get_current_state(sid_rooms.get(sid, DEFAULT_ROOM)),
+                                      to=sid, ignore_queue=True)
+                    for event, payload in pending:
+                        socketio.emit(event, payload, to=sid, ignore_queue=True)
+                    log.info("slow_consumer_recovered", "🐇 Client caught up", sid=sid, superseded=outbox.dropped)
+        except Exception as e:
+            log.error("task_error", "❌ Outbound Monitor Error", error=e)
+
+# --- Event Stream Listener (Robust Version) ---
+
+def read_room_events(positions):
+    """One blocking read of the event streams of `positions` ({room: last seen ID})."""
+    return backend.read_events(positions, EVENT_READ_COUNT, EVENT_READ_BLOCK)
+
+def decode_stream_entry(fields):
+    """
+    Returns (event name, data, packed) for the raw fields of an event stream
+    entry. `packed` is the compact wire payload of playback events, else None.
+    """
+    packed = fields.get(b'wire')
+    if packed is not None:
+        event_name, event_data = wire.decode(packed)
+        return event_name, event_data, packed
+    return fields[b'event'].decode(), json.loads(fields[b'data']), None
+
+def event_listener():
+    """
+    Tails the event stream of every locally joined room and re-emits each
+    event only to the Socket.IO room it belongs to. Rooms without local
+    members are never read at all.
+    The last processed ID of each stream is remembered, so after a backend
+    error the listener resumes exactly where it stopped instead of silently
+    losing the events in between.
+    """
+    log.info("task_started", "🎧 Event stream listener started. Waiting for events...")
+    while True:
+        if not stream_positions:
+            socketio.sleep(EVENT_READ_BLOCK)
+            continue
+        try:
+            batch = read_room_events(dict(stream_positions))
+            received = time.time()
+            for room, entries in batch:
+                for entry_id, fields in entries:
+                    if room not in stream_positions:
+                        break  # The last local member left during the read
+                    stream_positions[room] = entry_id
+
+                    event_name, event_data, packed = decode_stream_entry(fields)
+                    # Clients drop duplicates themselves, so a cache that was
+                    # already refreshed past this event must not suppress it
+                    state_cache.apply_event(room, event_name, event_data)
+
+                    trace = Tracer.parse(fields.get(b'trace'))
+                    if trace:
+                        # Traced events go to everyone as JSON, binary clients
+                        # included: the wire frame has no room for the trace id,
+                        # and every client acks it (see handle_sync_ack)
+                        event_data["trace"] = trace.get("id")
+                        packed = None
+
+                    log.debug("broadcast", "📣 Broadcasting event", room=room, event_name=event_name)
+                    emit_local(event_name, event_data, room, packed)
+                    EVENTS_BROADCAST.inc(event_name)
+                    entry_time = stream_entry_time(stream_positions[room])
+                    EVENT_LAG_SECONDS.observe(time.time() - entry_time)
+                    if trace:
+                        tracer.emitted(trace, room, event_name, entry_time, received)
+        except Exception as e:
+            LISTENER_RESTARTS.inc()
+            log.error("listener_error", "❌ Event Listener Error. Resuming in 2 seconds...", error=e)
             socketio.sleep(2)
 
+def events_since(room, version, current_version):
+    """
+    The room's events newer than `version`, oldest first, as (name, data,
+    packed) tuples (see decode_stream_entry) read back from its event stream. Returns None if the stream no
+    longer reaches back that far (or `version` predates a server reset), in
+    which case the caller has to fall back to a full sync_state.
+    """
+    if version > current_version:
+        return None
+    if version == current_version:
+        return []
+    events = []
+    before = None
+    while True:
+        page = backend.events_before(room, before, EVENT_READ_COUNT)
+        for entry_id, fields in page:
+            if int(fields[b'version']) <= version:
+                events.reverse()
+                return events
+            events.append(decode_stream_entry(fields))
+        if len(page) < EVENT_READ_COUNT:
+            break  # Reached the oldest retained event
+        before = page[-1][0]
+    if not events or events[-1][1]['version'] != version + 1:
+        return None  # Trimmed: the stream starts after the version we need
+    events.reverse()
+    return events
+
+# --- Sync Ticker ---
+
+def sync_ticker():
+    """
+    Pushes each locally joined room's playback state to every viewer once
+    per interval as a compact `sync_tick` frame. State comes from the local
+    cache; only rooms missing from it are read from the backend, so its load is
+    at most O(rooms) instead of O(viewers). Ticks carry the media time and
+    the server time it was set at; clients extrapolate with their synced clock.
+    """
+    log.info("task_started", "⏱️ Sync ticker started.")
+    while True:
+        socketio.sleep(SYNC_TICK_INTERVAL)
+        rooms = list(local_rooms)
+        if not rooms:
+            continue
+        try:
+            # One batched read for all rooms the cache can't answer
+            stale = state_cache.stale_rooms(rooms)
+            if stale:
+                for room, state_raw in zip(stale, backend.get_states(stale)):
+                    state_cache.store(room, state_raw)
+
+            for room in rooms:
+                state_raw = state_cache.peek(room)
+                if not state_raw or not state_raw.get("video_file_url"):
+                    continue
+                tick = playback.tick_fields(state_raw)
+                emit_local('sync_tick', tick, room,
+                           wire.encode('sync_tick', tick["t"], tick["u"], tick["p"] == 1, tick["v"]))
+        except Exception as e:
+            log.error("task_error", "❌ Sync Ticker Error", error=e)
+
 # --- HTTP Routes ---
 
 @app.route('/')
 def index():
-    return render_template('index.html')
-
-@app.route('/upload', methods=['POST'])
-def upload_video():
-    if 'file' not in request.files:
-        return jsonify({"success": False, "error": "No file part"}), 400
-    
-    file = request.files['file']
-    if file.filename == '':
-        return jsonify({"success": False, "error": "No selected file"}), 400
-        
-    if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        save_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-        file.save(save_path)
-        
-        video_url = url_for('static', filename=f'videos/{filename}')
-        uploader_sid = request.form.get('sid')
-        
-        if not uploader_sid:
-            return jsonify({"success": False, "error": "No client SID"}), 400
+    return render_template('index.html', room=DEFAULT_ROOM)
+
+@app.route('/room/<room_id>')
+def room_page(room_id):
+    return render_template('index.html', room=normalize_room(room_id))
+
+@app.route('/videos/<name>')
+def stream_video(name):
+    filename = secure_filename(name)
+    path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    if not filename or not allowed_file(filename) or not os.path.isfile(path):
+        abort(404)
+    # Content-addressed files use their digest as a strong ETag
+    return send_video(path, etag=digest_from_name(filename))
+
+def video_url_for(filename):
+    # Stored files are named by their content digest, so the URL never changes
+    # meaning and can be cached as immutable
+    return url_for('stream_video', name=filename)
+
+def publish_video_loaded(room, video_url, uploader_sid):
+    """
+    Points the room at a new video, makes the uploader its controller and
+    tells everyone, as one versioned `video_loaded` event.
+    """
+    version = backend.load_video(room, video_url, uploader_sid, time.time())
+    log.info("video_loaded", "💾 Video loaded", room=room, uploader=uploader_sid, version=version)
 
-        try:
-            pipe = r.pipeline()
-            pipe.hset(STATE_KEY, "video_file_url", video_url)
-            pipe.hset(STATE_KEY, "is_playing", "0")
-            pipe.hset(STATE_KEY, "current_time", "0.0")
-            pipe.hset(STATE_KEY, "last_update_timestamp", str(time.time()))
-            pipe.hset(STATE_KEY, "controller_sid", uploader_sid)
-            pipe.execute()
-
-            print(f"💾 Video uploaded by {uploader_sid}. Publishing events...")
-
-            r.publish(SYNC_CHANNEL, json.dumps({
-                "event": "video_loaded",
-                "data": {"url": video_url, "sid": uploader_sid}
-            }))
-            
-            r.publish(SYNC_CHANNEL, json.dumps({
-                "event": "controller_change",
-                "data": {"controller_sid": uploader_sid}
-            }))
-            
-            return ('', 204)
-            
-        except Exception as e:
-            print(f"Upload error: {e}")
-            return jsonify({"success": False, "error": "Server error"}), 500
+def partial_upload_path(upload_id):
+    return os.path.join(PARTIAL_UPLOAD_FOLDER, f"{upload_id}.part")
+
+def sweep_partial_uploads():
+    """Deletes the preallocated `.part` files of abandoned uploads whose record expired."""
+    try:
+        removed = sweep_partials(PARTIAL_UPLOAD_FOLDER, lambda upload_id: bool(backend.get_upload(upload_id)))
+        if removed:
+            log.info("partial_uploads_swept", "🧹 Removed abandoned partial uploads", count=removed)
+    except (OSError, BackendError) as e:
+        log.error("upload_error", "Partial upload sweep error", error=e)
+
+def complete_upload(upload_id, upload, uploader_sid):
+    """
+    Stores a fully received upload under its content digest and loads it in
+    the uploader's room. Returns False if the content does not match the
+    digest the client announced.
+    """
+    partial_path = partial_upload_path(upload_id)
+    backend.delete_upload(upload_id)
+
+    # Hashing hundreds of MB would stall the hub, so it runs in a native thread
+    digest = tpool.execute(hash_file, partial_path)
+    if upload.get("digest") and upload["digest"] != digest:
+        log.warning("upload_digest_mismatch", "Upload digest mismatch", upload=upload_id, expected=upload['digest'], got=digest)
+        discard(partial_path)
+        return False
+
+    name = find_blob(app.config['UPLOAD_FOLDER'], digest, ALLOWED_EXTENSIONS)
+    if name:
+        # Someone stored the same content meanwhile
+        discard(partial_path)
+    else:
+        name = blob_name(digest, upload["filename"].rsplit('.', 1)[1])
+        finalize(partial_path, os.path.join(app.config['UPLOAD_FOLDER'], name))
+
+    publish_video_loaded(upload["room"], video_url_for(name), uploader_sid)
+    if upload.get("created_at"):
+        UPLOAD_SECONDS.observe(time.time() - float(upload["created_at"]))
+    return True
+
+# --- Content-Addressed Lookup ---
+# HEAD /videos/by-hash/<sha256>        -> 200 if the content is already stored, 404 otherwise
+# POST /videos/by-hash/<sha256>/load   JSON {sid, room}: load stored content without uploading it
+
+@app.route('/videos/by-hash/<digest>', methods=['HEAD'])
+def video_by_hash(digest):
+    name = find_blob(app.config['UPLOAD_FOLDER'], digest, ALLOWED_EXTENSIONS) if is_valid_digest(digest) else None
+    if not name:
+        return ('', 404)
+    return ('', 200, {"Content-Location": video_url_for(name)})
+
+@app.route('/videos/by-hash/<digest>/load', methods=['POST'])
+def load_video_by_hash(digest):
+    info = request.get_json(silent=True) or {}
+    uploader_sid = info.get('sid')
+    room = normalize_room(info.get('room'))
+    if not uploader_sid:
+        return jsonify({"success": False, "error": "No client SID"}), 400
+
+    name = find_blob(app.config['UPLOAD_FOLDER'], digest, ALLOWED_EXTENSIONS) if is_valid_digest(digest) else None
+    if not name:
+        return jsonify({"success": False, "error": "Unknown video"}), 404
+
+    try:
+        publish_video_loaded(room, video_url_for(name), uploader_sid)
+    except BackendError as e:
+        log.error("load_by_hash_error", "Load by hash error", error=e)
+        return jsonify({"success": False, "error": "Server error"}), 500
+    return ('', 204)
+
+# --- Chunked Upload Protocol ---
+# POST  /uploads               JSON {filename, size, sid, room, digest?} -> 201, Location: /uploads/<id>
+# PATCH /uploads/<id>          Upload-Offset: <chunk start>, body = one chunk (any order, in parallel)
+#                              X-Client-Sid: uploader's member id (optional; overrides the one given at creation)
+# HEAD  /uploads/<id>          -> Upload-Offset: end of the contiguous received prefix (for resuming)
+# The request that delivers the last missing chunk verifies the digest and finalizes the upload.
+
+@app.route('/uploads', methods=['POST'])
+def create_upload():
+    info = request.get_json(silent=True) or {}
+    filename = secure_filename(str(info.get('filename', '')))
+    uploader_sid = info.get('sid')
+    room = normalize_room(info.get('room'))
+    digest = str(info.get('digest') or '').lower()
+    try:
+        size = int(info.get('size', 0))
+    except (TypeError, ValueError):
+        size = 0
+
+    if not filename or not allowed_file(filename):
+        return jsonify({"success": False, "error": "File type not allowed"}), 400
+    if not uploader_sid:
+        return jsonify({"success": False, "error": "No client SID"}), 400
+    if not 0 < size <= MAX_UPLOAD_SIZE:
+        return jsonify({"success": False, "error": "Invalid file size"}), 400
+    if digest and not is_valid_digest(digest):
+        return jsonify({"success": False, "error": "Invalid digest"}), 400
+
+    upload_id = uuid.uuid4().hex
+    try:
+        create_partial(partial_upload_path(upload_id), size)
+        backend.create_upload(upload_id, {
+            "filename": filename,
+            "size": size,
+            "chunks": chunk_count(size),
+            "room": room,
+            "sid": uploader_sid,
+            "digest": digest,  # Empty if the client could not hash the file
+            "created_at": time.time()
+        }, UPLOAD_TTL)
+    except (OSError, BackendError) as e:
+        log.error("upload_error", "Upload create error", error=e)
+        discard(partial_upload_path(upload_id))
+        return jsonify({"success": False, "error": "Server error"}), 500
+
+    location = url_for('upload_chunk', upload_id=upload_id)
+    return jsonify({"success": True, "url": location, "chunk_size": UPLOAD_CHUNK_SIZE}), 201, {"Location": location}
+
+@app.route('/uploads/<upload_id>', methods=['HEAD'])
+def upload_status(upload_id):
+    try:
+        upload = backend.get_upload(upload_id)
+        if not upload:
+            return ('', 404)
+        size = int(upload["size"])
+        first_missing = backend.first_missing_chunk(upload_id)
+    except BackendError as e:
+        log.error("upload_error", "Upload status error", error=e)
+        return ('', 500)
+
+    return ('', 200, {
+        "Upload-Offset": str(min(first_missing * UPLOAD_CHUNK_SIZE, size)),
+        "Upload-Length": str(size),
+        "Upload-Chunk-Size": str(UPLOAD_CHUNK_SIZE),
+        "Cache-Control": "no-store"
+    })
+
+@app.route('/uploads/<upload_id>', methods=['PATCH'])
+def upload_chunk(upload_id):
+    try:
+        upload = backend.get_upload(upload_id)
+    except BackendError as e:
+        log.error("upload_error", "Upload chunk error", error=e)
+        return jsonify({"success": False, "error": "Server error"}), 500
+    if not upload:
+        return jsonify({"success": False, "error": "Unknown upload"}), 404
+
+    size = int(upload["size"])
+    try:
+        offset = int(request.headers.get('Upload-Offset', ''))
+    except ValueError:
+        return jsonify({"success": False, "error": "Missing Upload-Offset"}), 400
 
-    return jsonify({"success": False, "error": "File type not allowed"}), 400
+    index, misaligned = divmod(offset, UPLOAD_CHUNK_SIZE)
+    if misaligned or not 0 <= index < int(upload["chunks"]):
+        return jsonify({"success": False, "error": "Offset is not a chunk boundary"}), 400
+    length = expected_chunk_length(index, size)
+    if request.content_length != length:
+        return jsonify({"success": False, "error": f"Chunk must be {length} bytes"}), 400
+
+    try:
+        written = write_chunk(partial_upload_path(upload_id), offset, request.stream, length)
+        UPLOAD_BYTES.inc(amount=written)
+        if written != length:
+            return jsonify({"success": False, "error": "Incomplete chunk"}), 400
+
+        result = backend.mark_chunk(upload_id, index, UPLOAD_TTL)
+        if result == -1:
+            return jsonify({"success": False, "error": "Unknown upload"}), 404
+        if result == 1 and not complete_upload(upload_id, upload, request.headers.get('X-Client-Sid') or upload["sid"]):
+            return jsonify({"success": False, "error": "Uploaded content does not match its digest"}), 422
+    except (OSError, BackendError) as e:
+        log.error("upload_error", "Upload chunk error", error=e)
+        return jsonify({"success": False, "error": "Server error"}), 500
+
+    return ('', 204, {"Upload-Offset": str(offset + length)})
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
 
 # --- Socket.IO Event Handlers ---
 
 @socketio.on('connect')
-def handle_connect():
+@handled('connect')
+def handle_connect(auth=None):
     sid = request.sid
+    room = normalize_room(request.args.get('room'))
+    # Clients that ask for it get playback events in the compact wire encoding
+    binary = wire.negotiate(request.args.get('wire')) == wire.BINARY
+    join_room(binary_room(room) if binary else room)
+    if binary:
+        binary_sids.add(sid)
+    sid_rooms[sid] = room
+    local_rooms[room].add(sid)
+    # A client reconnecting within its grace period gets its identity (and
+    # with it its role) back; anyone else becomes a new member
+    auth = auth if isinstance(auth, dict) else {}
+    member = resume_tokens.verify(auth.get('resume'), room) or resume_tokens.new_member_id()
+    sid_members[sid] = member
+    local_members[member] += 1
     try:
-        r.sadd(USER_SET_KEY, sid)
-        # Send current state to the new user immediately
-        emit('sync_state', get_current_state(), to=sid)
+        state_raw = state_cache.peek(room)
+        if state_raw is not None and room in stream_positions:
+            backend.touch(room, member, time.time())
+        else:
+            # Register the room, join its presence set, read its state and the
+            # matching event stream position in one atomic round trip
+            state_raw, latest_id = backend.join(room, member, time.time())
+            state_cache.store(room, state_raw)
+            # Start tailing the room right after the state we just read
+            stream_positions.setdefault(room, latest_id)
+
+        # Send the client its identity and the drift-correction tuning immediately
+        emit('session', {
+            "member_id": member,
+            "resume_token": resume_tokens.issue(member, room),
+            "controller_sid": state_raw.get("controller_sid", ""),
+            "controller_token": state_raw.get("controller_token")
+        }, to=sid)
+        emit('sync_config', client_sync_config(), to=sid)
+
+        # A reconnecting client passes the last version it applied and only
+        # gets the events it missed; everyone else gets the full state
+        state = parse_state(state_raw)
+        events = None
+        since = auth.get('since')
+        if isinstance(since, int) and since > 0:
+            events = events_since(room, since, state["version"])
+        if events is None:
+            emit('sync_state', state, to=sid)
+        else:
+            for event_name, event_data, packed in events:
+                emit(event_name, packed if binary and packed is not None else event_data, to=sid)
     except Exception as e:
-        print(f"Connect error: {e}")
+        log.error("connect_error", "Connect error", sid=sid, error=e)
 
 @socketio.on('disconnect')
+@handled('disconnect')
 def handle_disconnect():
     sid = request.sid
-    try:
-        r.srem(USER_SET_KEY, sid)
-        if is_controller(sid):
-            elect_new_controller()
-    except Exception as e:
-        print(f"Disconnect error: {e}")
+    room = sid_rooms.pop(sid, DEFAULT_ROOM)
+    member = sid_members.pop(sid, sid)
+    local_members[member] -= 1
+    if local_members[member] <= 0:
+        del local_members[member]
+    binary_sids.discard(sid)
+    outboxes.pop(sid, None)
+    members = local_rooms.get(room)
+    if members is not None:
+        members.discard(sid)
+        if not members:
+            # Stop tailing the room; its cache entry would go stale without the events
+            del local_rooms[room]
+            stream_positions.pop(room, None)
+            state_cache.invalidate(room)
+    # Presence and role survive transport blips: the member is only removed
+    # (and control handed over) if it doesn't reconnect within the grace period
+    if member not in local_members:
+        socketio.start_background_task(expire_member, room, member, time.time())
 
 @socketio.on('request_sync')
+@handled('request_sync', timed=True)
 def handle_request_sync():
-    emit('sync_state', get_current_state())
+    room = sid_rooms.get(request.sid, DEFAULT_ROOM)
+    emit_to_client(request.sid, 'sync_state', get_current_state(room))
+
+@socketio.on('time_sync')
+@handled('time_sync')
+def handle_time_sync(data=None):
+    """
+    Clock probe for Cristian-style offset estimation. The client timestamps
+    the request and the ack, and keeps the sample with the smallest RTT.
+    """
+    return {"server_time": time.time()}
+
+@socketio.on('sync_ack')
+@handled('sync_ack')
+def handle_sync_ack(data):
+    """
+    A sampled fraction of viewers report when they received a control event,
+    on the server clock. This feeds the adaptive lead time of scheduled plays.
+    Traced events are always acknowledged, and close their trace.
+    """
+    try:
+        received_at = float(data['received_at'])
+        fanout_latency.add(received_at - float(data['issued_at']))
+        if data.get('trace'):
+            tracer.acked(str(data['trace']), request.sid, received_at)
+    except (KeyError, TypeError, ValueError):
+        pass
 
 # --- Playback Control Events ---
 
 @socketio.on('play')
+@handled('play', timed=True)
 def handle_play(data):
+    trace = tracer.begin(data.get('sent_at'))
     sid = request.sid
-    if not is_controller(sid): 
-        print(f"⚠️ Ignored PLAY from non-controller: {sid}")
-        return
-
+    member = sid_members.get(sid, sid)
     current_time = float(data.get('time', 0.0))
-    print(f"▶️ Controller {sid} PLAY at {current_time}")
+    token = str(data.get('token', ''))
 
-    pipe = r.pipeline()
-    pipe.hset(STATE_KEY, "is_playing", "1")
-    pipe.hset(STATE_KEY, "current_time", str(current_time))
-    pipe.hset(STATE_KEY, "last_update_timestamp", str(time.time()))
-    pipe.execute()
+    room = sid_rooms.get(sid, DEFAULT_ROOM)
+    drop_pending_seek(room, member)
+    # Everyone, the controller included, starts at the same future server time
+    play_at = time.time() + play_lead_time()
 
-    r.publish(SYNC_CHANNEL, json.dumps({
-        "event": "sync_play",
-        "data": {"time": current_time, "sid": sid}
-    }))
+    if not apply_control_transition(room, member, token, "sync_play", current_time, is_playing=True, effective_at=play_at,
+                                    trace=trace):
+        log.info("ignored_control", "⚠️ Ignored PLAY from non-controller", member=member)
+        return
+
+    log.info("play", "▶️ Controller PLAY", room=room, member=member, time=current_time, play_at=round(play_at, 3))
+    return {"time": current_time, "play_at": play_at}
 
 @socketio.on('pause')
+@handled('pause', timed=True)
 def handle_pause(data):
+    trace = tracer.begin(data.get('sent_at'))
     sid = request.sid
-    if not is_controller(sid): 
-        print(f"⚠️ Ignored PAUSE from non-controller: {sid}")
-        return
-
+    member = sid_members.get(sid, sid)
     current_time = float(data.get('time', 0.0))
-    print(f"⏸️ Controller {sid} PAUSE at {current_time}")
+    token = str(data.get('token', ''))
 
-    pipe = r.pipeline()
-    pipe.hset(STATE_KEY, "is_playing", "0")
-    pipe.hset(STATE_KEY, "current_time", str(current_time))
-    pipe.hset(STATE_KEY, "last_update_timestamp", str(time.time()))
-    pipe.execute()
+    room = sid_rooms.get(sid, DEFAULT_ROOM)
+    drop_pending_seek(room, member)
 
-    r.publish(SYNC_CHANNEL, json.dumps({
-        "event": "sync_pause",
-        "data": {"time": current_time, "sid": sid}
-    }))
+    if not apply_control_transition(room, member, token, "sync_pause", current_time, is_playing=False, trace=trace):
+        log.info("ignored_control", "⚠️ Ignored PAUSE from non-controller", member=member)
+        return
+
+    log.info("pause", "⏸️ Controller PAUSE", room=room, member=member, time=current_time)
 
 @socketio.on('seek')
+@handled('seek', timed=True)
 def handle_seek(data):
+    trace = tracer.begin(data.get('sent_at'))
     sid = request.sid
-    if not is_controller(sid): 
-        return
-
+    member = sid_members.get(sid, sid)
     current_time = float(data.get('time', 0.0))
-    print(f"⏩ Controller {sid} SEEK to {current_time}")
+    token = str(data.get('token', ''))
 
-    pipe = r.pipeline()
-    pipe.hset(STATE_KEY, "current_time", str(current_time))
-    pipe.hset(STATE_KEY, "last_update_timestamp", str(time.time()))
-    pipe.execute()
+    room = sid_rooms.get(sid, DEFAULT_ROOM)
 
-    r.publish(SYNC_CHANNEL, json.dumps({
-        "event": "sync_seek",
-        "data": {"time": current_time, "sid": sid}
-    }))
+    if SEEK_COALESCE_WINDOW <= 0:
+        if not apply_control_transition(room, member, token, "sync_seek", current_time, trace=trace):
+            return
+        log.info("seek", "⏩ Controller SEEK", room=room, member=member, time=current_time)
+        return {"time": current_time}
+
+    if not is_controller(member, room, token):
+        return
+    # Acknowledge right away; the room hears about it when the burst is over
+    queue_seek(room, member, token, current_time, trace)
+    return {"time": current_time}
 
 
 def main():
+    # Workers share backend state with their siblings, so only a standalone
+    # server (or the launcher, once) may wipe it.
+    standalone = WORKER_ID is None
     try:
         os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-        initialize_redis_state()
+        os.makedirs(PARTIAL_UPLOAD_FOLDER, exist_ok=True)
+        if standalone:
+            backend.initialize()
+        else:
+            backend.prepare()
+        sweep_partial_uploads()
         
-        # Start the Redis listener in a background thread
-        socketio.start_background_task(redis_event_listener)
+        # Start the event stream listener in a background thread
+        socketio.start_background_task(event_listener)
+        socketio.start_background_task(sync_ticker)
+        socketio.start_background_task(outbound_monitor)
+        socketio.start_background_task(presence_heartbeat)
+        socketio.start_background_task(presence_reaper)
         
-        print(f"🚀 Server starting on http://0.0.0.0:5000")
-        socketio.run(app, host='0.0.0.0', port=5000, log_output=True, use_reloader=False)
+        worker = "" if standalone else f" (worker {WORKER_ID})"
+        log.info("startup", f"🚀 Server starting on http://{HOST}:{PORT}{worker}")
+        socketio.run(app, host=HOST, port=PORT, log_output=standalone, use_reloader=False)
         
     except KeyboardInterrupt:
-        print("\nShutting down...")
+        log.info("shutdown", "Shutting down...")
     finally:
-        r.delete(STATE_KEY)
-        r.delete(USER_SET_KEY)
+        if standalone:
+            backend.clear()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,167 @@
+"""
+Pluggable storage for room state, presence, the controller lease, event
+streams and upload bookkeeping.
+
+server.py only talks to a StateBackend. Two engines implement it:
+
+    redis    (redis_backend.py)  shared by every worker; required for
+             launcher.py's multi-worker mode. Every mutation is one atomic
+             Lua script call.
+    memory   (memory_backend.py) plain in-process data structures with the
+             same semantics, for single-node deployments, test rigs and as
+             the zero-network-hop baseline in benchmarks. State does not
+             survive a restart and can't be shared between processes.
+
+Pick one with ECHOSTREAM_STATE_BACKEND (default redis).
+
+Conventions shared by both engines:
+    * State hashes are dicts of strings, exactly as Redis returns them.
+    * Every mutation bumps the room's `version` and appends the resulting
+      event to the room's event stream (capped at EVENT_STREAM_MAXLEN).
+    * Stream entries are (entry id, fields): ids are Redis-style
+      "<milliseconds>-<sequence>" strings, fields the raw entry fields with
+      bytes keys (b'event', b'version', b'wire' or b'data', maybe b'trace').
+"""
+import os
+
+BACKENDS = ("redis", "memory")
+
+
+class BackendError(Exception):
+    """The backend's store is unavailable or rejected a command."""
+
+
+class StateBackend:
+    # Whether several server processes can share this backend
+    shared = False
+
+    # --- Lifecycle ---
+
+    def connect(self):
+        """Checks that the store is reachable; exits the process if it isn't."""
+
+    def initialize(self):
+        """Wipes every room and prepares the backend (standalone start)."""
+        raise NotImplementedError
+
+    def prepare(self):
+        """Prepares the backend without touching existing rooms (worker start)."""
+
+    def clear(self):
+        """Deletes the state, presence, lease and events of every room."""
+        raise NotImplementedError
+
+    # --- Room State ---
+
+    def get_state(self, room):
+        """The room's raw state hash ({} if the room doesn't exist)."""
+        raise NotImplementedError
+
+    def get_states(self, rooms):
+        """The raw state hashes of `rooms`, in order, in one round trip."""
+        return [self.get_state(room) for room in rooms]
+
+    def join(self, room, member, now):
+        """
+        Registers the room (creating its default state), marks `member` present
+        at `now`, and returns (raw state, id of the room's latest stream entry
+        or "0-0") as one atomic snapshot.
+        """
+        raise NotImplementedError
+
+    # --- Transitions ---
+
+    def control_transition(self, room, member, token, event_name, media_time, effective_at, playing_flag,
+                           issued_at, trace=""):
+        """
+        Applies a play/pause/seek if `member` holds the controller lease and
+        presents the current fencing `token`. `playing_flag` is "1", "0" or ""
+        (unchanged). Returns the new version, or 0 if the command was rejected.
+        """
+        raise NotImplementedError
+
+    def load_video(self, room, url, uploader, now):
+        """Points the room at a new video and makes `uploader` its controller. Returns the new version."""
+        raise NotImplementedError
+
+    # --- Presence ---
+
+    def touch(self, room, member, now):
+        """Marks `member` present in `room` at `now`."""
+        raise NotImplementedError
+
+    def heartbeat(self, rooms, now):
+        """
+        Batched presence refresh: `rooms` is a list of (room, members,
+        controller), where `controller` is the local member whose lease to
+        renew, or None.
+        """
+        raise NotImplementedError
+
+    def remove_member(self, room, member, left_at):
+        """
+        Removes a member that left at `left_at` unless it has been seen since,
+        handing control to the most recently seen remaining member if it was
+        the controller. Returns the new version if control changed, else 0.
+        """
+        raise NotImplementedError
+
+    def reap(self, owner, cutoff):
+        """
+        Evicts members last seen at or before `cutoff` from every room and
+        re-elects controllers that were evicted or whose lease expired.
+        Returns [(room, version or 0)], or None if another node (`owner`
+        identifies this one) is reaping this round.
+        """
+        raise NotImplementedError
+
+    # --- Events ---
+
+    def read_events(self, positions, count, block):
+        """
+        Entries newer than `positions` ({room: last seen entry id}), at most
+        `count` per room, waiting up to `block` seconds for one to arrive.
+        Returns [(room, [(entry id, fields), ...]), ...].
+        """
+        raise NotImplementedError
+
+    def events_before(self, room, before, count):
+        """Up to `count` of the room's entries older than entry id `before` (None: newest), newest first."""
+        raise NotImplementedError
+
+    # --- Uploads ---
+
+    def create_upload(self, upload_id, fields, ttl):
+        raise NotImplementedError
+
+    def get_upload(self, upload_id):
+        """The upload's fields ({} if unknown or expired)."""
+        raise NotImplementedError
+
+    def first_missing_chunk(self, upload_id):
+        """Index of the first chunk not received yet."""
+        raise NotImplementedError
+
+    def mark_chunk(self, upload_id, index, ttl):
+        """
+        Records a received chunk and refreshes the upload's TTL. Returns -1 if
+        the upload is unknown, 1 to exactly one caller when this chunk
+        completed the upload, and 0 otherwise.
+        """
+        raise NotImplementedError
+
+    def delete_upload(self, upload_id):
+        raise NotImplementedError
+
+
+def create_backend(name=None):
+    """The backend named by `name` or ECHOSTREAM_STATE_BACKEND (default redis)."""
+    name = (name or os.environ.get("ECHOSTREAM_STATE_BACKEND", "redis")).lower()
+    if name == "memory":
+        from memory_backend import MemoryBackend
+        return MemoryBackend()
+    if name == "redis":
+        # Imported lazily so a memory-backed server never needs a Redis server
+        from redis_backend import RedisBackend
+        return RedisBackend()
+    raise ValueError(f"Unknown state backend {name!r} (expected one of {', '.join(BACKENDS)})")
@@ -0,0 +1,97 @@
+"""
+Per-process read-through cache of room state.
+
+Each cached entry is the raw state hash of a room, stamped with the state
+version it reflects. Versioned sync events flowing through the Redis
+listener update entries in place; duplicates and stale events are ignored,
+and a version gap (a missed event) or an unversioned event drops the entry
+so the next read falls back to Redis. Entries also expire after `max_age`
+seconds as a safety net.
+"""
+import time
+
+# Fields of a control event that map straight onto the state hash
+EVENT_FIELDS = {
+    "time": "current_time",
+    "updated_at": "last_update_timestamp",
+    "sid": "controller_sid",
+    "controller_sid": "controller_sid",
+    "token": "controller_token",
+    "url": "video_file_url",
+}
+
+
+class StateCache:
+
+    def __init__(self, loader, max_age=10.0):
+        # loader(room) -> raw state hash from Redis
+        self.loader = loader
+        self.max_age = max_age
+        self.entries = {}  # room -> (raw state, loaded_at)
+
+    def get(self, room):
+        """Returns the raw state hash of `room`, loading it from Redis on a miss."""
+        entry = self.entries.get(room)
+        if entry is not None and time.monotonic() - entry[1] < self.max_age:
+            return entry[0]
+        state = self.loader(room)
+        self.store(room, state)
+        return state
+
+    def peek(self, room):
+        """Returns the cached state hash of `room` without loading it, or None."""
+        entry = self.entries.get(room)
+        if entry is None or time.monotonic() - entry[1] >= self.max_age:
+            return None
+        return entry[0]
+
+    def store(self, room, state):
+        self.entries[room] = (dict(state), time.monotonic())
+
+    def stale_rooms(self, rooms):
+        """The subset of `rooms` that must be (re)loaded from Redis."""
+        now = time.monotonic()
+        return [room for room in rooms
+                if room not in self.entries or now - self.entries[room][1] >= self.max_age]
+
+    def invalidate(self, room):
+        self.entries.pop(room, None)
+
+    def clear(self):
+        self.entries.clear()
+
+    def apply_event(self, room, event_name, data):
+        """
+        Folds a sync event into the cached state. Returns False if the event
+        is a duplicate or older than the cached state (and should not be
+        re-applied), True otherwise.
+        """
+        entry = self.entries.get(room)
+        if entry is None:
+            return True
+
+        state, loaded_at = entry
+        version = data.get("version") if isinstance(data, dict) else None
+        if version is None:
+            # Every state mutation is versioned; anything else can't be ordered, so reload
+            self.invalidate(room)
+            return True
+
+        cached_version = int(state.get("version", 0))
+        if version <= cached_version:
+            return False
+        if version != cached_version + 1:
+            # We missed at least one update: fall back to Redis
+            self.invalidate(room)
+            return True
+
+        for event_key, state_key in EVENT_FIELDS.items():
+            if event_key in data:
+                state[state_key] = str(data[event_key])
+        if "playing" in data:
+            state["is_playing"] = "1" if data["playing"] else "0"
+            if data["playing"]:
+                state["play_at"] = str(data["updated_at"])
+        state["version"] = str(version)
+        self.entries[room] = (state, loaded_at)
+        return True
@@ -2,17 +2,46 @@ document.addEventListener('DOMContentLoaded', () => {
 
     // --- Global State ---
     let isController = false;
+    // Fencing token of the current controller; our control events must present it
+    let controllerToken = null;
+    // Our member id in the room; unlike socket.id it survives reconnects
     let localSID = null;
+    // Signed token that gets us the same member id (and role) back after a reconnect
+    let resumeToken = null;
     let isSeeking = false; 
     let isServerSyncing = false; 
-    let antiDriftInterval = null;
     let hasJoined = false; 
+    // Estimated server clock minus local clock (seconds), from the time_sync exchange
+    let clockOffset = 0;
+    let clockSyncInterval = null;
+    // Pending scheduled start of a sync_play
+    let scheduledPlayTimer = null;
+    // Highest room state version applied so far (every server-side state change bumps it)
+    let stateVersion = 0;
+    // Version we had when the connection dropped; the server replays what came after it
+    let resumeVersion = 0;
+
+    // Watch party this page belongs to (rendered by the server from /room/<id>)
+    const room = document.body.dataset.room || 'lobby';
 
     // --- Configuration ---
-    // Add a small offset to account for network transmission time (200ms)
-    const LATENCY_COMPENSATION = 0.2; 
-    // Tighter drift threshold for better sync (250ms)
-    const DRIFT_THRESHOLD = 0.25;
+    // Drift-correction tuning. These are defaults; the server pushes its own
+    // values in a `sync_config` event on connect.
+    const syncConfig = {
+        drift_deadband: 0.04,        // Below this drift, play at normal speed
+        hard_seek_threshold: 1.0,    // Above this, seek instead of nudging the rate
+        seek_threshold: 0.25,        // Seek threshold when the rate can't be used (paused, discrete events)
+        rate_gain: 0.5,              // playbackRate change per second of drift
+        max_rate_adjustment: 0.05,   // playbackRate stays within 1 +/- this
+        fanout_ack_sample_rate: 0.1, // Fraction of control events acknowledged (feeds the server's play lead time)
+    };
+    // Chunks uploaded concurrently, and attempts per chunk before giving up
+    const PARALLEL_UPLOADS = 3;
+    const UPLOAD_RETRIES = 5;
+    // Clock sync: probes per round (lowest RTT wins), spacing, and refresh period
+    const TIME_SYNC_SAMPLES = 8;
+    const TIME_SYNC_SPACING_MS = 100;
+    const TIME_SYNC_REFRESH_MS = 60000;
 
     // --- DOM Elements ---
     const video = document.getElementById('video-player');
@@ -29,6 +58,16 @@ document.addEventListener('DOMContentLoaded', () => {
     const socket = io({
         transports: ['websocket', 'polling'],
         reconnectionAttempts: 5,
+        // Playback events come as compact binary frames (see unpackEvent)
+        query: { room, wire: 'binary' },
+        // Sent on every (re)connect: resume our identity and ask for the
+        // missed events instead of a full resync
+        auth: (cb) => {
+            const auth = {};
+            if (resumeToken) auth.resume = resumeToken;
+            if (resumeVersion > 0) auth.since = resumeVersion;
+            cb(auth);
+        },
     });
 
     // --- Join / Audio Unlock Logic ---
@@ -44,6 +83,43 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     }
 
+    // --- Clock Synchronization ---
+
+    function serverNow() {
+        return Date.now() / 1000 + clockOffset;
+    }
+
+    // Media position now, given the media time the server set at server time `since`
+    function positionAt(mediaTime, since, isPlaying) {
+        if (!isPlaying || !since) return mediaTime;
+        return mediaTime + Math.max(0, serverNow() - since);
+    }
+
+    function sampleClock() {
+        return new Promise(resolve => {
+            const t0 = Date.now() / 1000;
+            socket.timeout(2000).emit('time_sync', {}, (err, response) => {
+                const t1 = Date.now() / 1000;
+                if (err || !response) return resolve(null);
+                // Cristian: the server read its clock half an RTT before we got the reply
+                resolve({ rtt: t1 - t0, offset: response.server_time - (t0 + (t1 - t0) / 2) });
+            });
+        });
+    }
+
+    async function syncClock() {
+        let best = null;
+        for (let i = 0; i < TIME_SYNC_SAMPLES; i++) {
+            const sample = await sampleClock();
+            if (sample && (!best || sample.rtt < best.rtt)) best = sample;
+            await new Promise(resolve => setTimeout(resolve, TIME_SYNC_SPACING_MS));
+        }
+        if (best) {
+            clockOffset = best.offset;
+            console.log(`Clock sync: offset=${(best.offset * 1000).toFixed(1)}ms, rtt=${(best.rtt * 1000).toFixed(1)}ms`);
+        }
+    }
+
     // --- Utility Functions ---
 
     function updateControls() {
@@ -58,9 +134,49 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
-    function checkDrift() {
-        if (isController || !video.src || video.readyState < 1 || !hasJoined) return;
-        socket.emit('request_sync');
+    // Binary playback event: u8 code, u8 flags (bit 0: playing), u32 version,
+    // f64 media time, f64 server time it is valid at, f64 issue time (little-endian).
+    // JSON payloads (including traced events, which carry data.trace) are passed through unchanged.
+    function unpackEvent(payload) {
+        if (!(payload instanceof ArrayBuffer)) return payload;
+        const view = new DataView(payload);
+        const data = {
+            playing: (view.getUint8(1) & 1) === 1,
+            version: view.getUint32(2, true),
+            time: view.getFloat64(6, true),
+            updated_at: view.getFloat64(14, true),
+        };
+        const issuedAt = view.getFloat64(22, true);
+        if (issuedAt) data.issued_at = issuedAt;
+        return data;
+    }
+
+    // Ordering guard for everything the server pushes. Events must be strictly
+    // newer than what we have (an equal version is a duplicate); full-state
+    // snapshots (sync_state, sync_tick) may repeat the current version.
+    function acceptVersion(version, isSnapshot) {
+        if (version === undefined || version === null) return true;
+        if (version < stateVersion || (version === stateVersion && !isSnapshot)) {
+            console.log(`Discarding stale update v${version} (have v${stateVersion})`);
+            return false;
+        }
+        stateVersion = version;
+        return true;
+    }
+
+    function setController(controllerSid, token, announce = true) {
+        controllerToken = token;
+        const oldIsController = isController;
+        isController = (controllerSid === localSID);
+        statusController.textContent = controllerSid || 'None';
+        updateControls();
+
+        if (announce && isController && !oldIsController) {
+             if (uploadStatus) {
+                 uploadStatus.textContent = `Upload successful! You are the new controller.`;
+                 uploadStatus.className = 'success';
+             }
+        }
     }
 
     function syncToState(state) {
@@ -76,67 +192,156 @@ document.addEventListener('DOMContentLoaded', () => {
             return;
         }
 
-        // 2. Sync Time (Drift Correction)
-        const serverTime = parseFloat(state.current_time || 0.0);
-        const clientTime = video.currentTime;
-        const drift = Math.abs(serverTime - clientTime);
+        // 2. Sync Controller Status
+        isController = (state.controller_sid === localSID);
+        statusController.textContent = state.controller_sid || 'None';
+        updateControls();
 
-        // We only correct drift if:
-        // a. It is larger than our threshold
-        // b. We are NOT currently in a "server sync" action (like seeking)
-        if (drift > DRIFT_THRESHOLD && !isServerSyncing) { 
-            console.warn(`Drift Correction: Server=${serverTime.toFixed(3)}, Client=${clientTime.toFixed(3)}, Drift=${drift.toFixed(3)}`);
-            video.currentTime = serverTime;
+        // 3. Sync Time and Play/Pause State
+        syncPlayback(positionAt(parseFloat(state.current_time || 0.0), state.server_time, state.is_playing), state.is_playing);
+    }
+
+    function syncPlayback(serverTime, isPlaying) {
+        // Drift Correction
+        // We only correct drift if we are NOT currently in a "server sync" action (like seeking)
+        if (!isServerSyncing) {
+            correctDrift(serverTime, isPlaying);
         }
 
-        // 3. Sync Play/Pause State
-        if (state.is_playing && video.paused) {
+        // Play/Pause State
+        if (isPlaying && video.paused) {
             attemptPlay();
-        } else if (!state.is_playing && !video.paused) {
+        } else if (!isPlaying && !video.paused) {
             video.pause();
         }
+    }
 
-        // 4. Sync Controller Status
-        isController = (state.controller_sid === localSID);
-        statusController.textContent = state.controller_sid || 'None';
-        updateControls();
+    // Proportional controller: small drifts are absorbed by nudging playbackRate,
+    // which avoids a decoder seek (and the re-buffering it causes). Only large
+    // drifts, or drift while paused, are fixed with a hard seek.
+    function correctDrift(serverTime, isPlaying) {
+        const clientTime = video.currentTime;
+        const drift = serverTime - clientTime;  // Positive: we are behind
+        const absDrift = Math.abs(drift);
+        const seekThreshold = isPlaying ? syncConfig.hard_seek_threshold : syncConfig.seek_threshold;
+
+        if (absDrift > seekThreshold) {
+            console.warn(`Drift Correction (seek): Server=${serverTime.toFixed(3)}, Client=${clientTime.toFixed(3)}, Drift=${drift.toFixed(3)}`);
+            video.playbackRate = 1.0;
+            video.currentTime = serverTime;
+        } else if (isPlaying && absDrift > syncConfig.drift_deadband) {
+            const limit = syncConfig.max_rate_adjustment;
+            const adjustment = Math.max(-limit, Math.min(limit, syncConfig.rate_gain * drift));
+            video.playbackRate = 1.0 + adjustment;
+        } else if (video.playbackRate !== 1.0) {
+            video.playbackRate = 1.0;
+        }
     }
 
     function attemptPlay() {
-        if (!hasJoined) return;
+        if (!hasJoined) return Promise.resolve();
         var playPromise = video.play();
         if (playPromise !== undefined) {
-            playPromise.catch(error => {
+            return playPromise.catch(error => {
                 console.warn("Autoplay prevented or loading.");
             });
         }
+        return Promise.resolve();
+    }
+
+    function cancelScheduledPlay() {
+        if (scheduledPlayTimer) {
+            clearTimeout(scheduledPlayTimer);
+            scheduledPlayTimer = null;
+            isServerSyncing = false;
+        }
+    }
+
+    // Hold at `mediaTime` and start playing exactly at server time `playAt`
+    function schedulePlay(mediaTime, playAt) {
+        cancelScheduledPlay();
+        isServerSyncing = true;
+        video.playbackRate = 1.0;
+        const delayMs = (playAt - serverNow()) * 1000;
+        if (delayMs > 0) {
+            if (!video.paused) video.pause();
+            if (Math.abs(video.currentTime - mediaTime) > syncConfig.seek_threshold) {
+                video.currentTime = mediaTime;
+            }
+        }
+        scheduledPlayTimer = setTimeout(() => {
+            scheduledPlayTimer = null;
+            // Late arrivals (delay <= 0) jump to where everyone else already is
+            const targetTime = positionAt(mediaTime, playAt, true);
+            if (Math.abs(video.currentTime - targetTime) > syncConfig.seek_threshold) {
+                video.currentTime = targetTime;
+            }
+            attemptPlay().then(() => { isServerSyncing = false; });
+        }, Math.max(0, delayMs));
+    }
+
+    // Report receipt time (server clock) for a sample of control events, and for every traced one
+    function ackSyncEvent(data) {
+        if (data.issued_at && (data.trace || Math.random() < syncConfig.fanout_ack_sample_rate)) {
+            socket.emit('sync_ack', { issued_at: data.issued_at, received_at: serverNow(), trace: data.trace });
+        }
     }
 
     // --- Socket.IO Event Handlers ---
 
     socket.on('connect', () => {
-        localSID = socket.id;
-        console.log(`Connected: ${localSID}`);
+        console.log(`Connected: ${socket.id}`);
         statusConnection.textContent = 'Connected';
         statusConnection.className = 'connected';
-        if (antiDriftInterval) clearInterval(antiDriftInterval);
-        // Check drift more frequently (every 1s instead of 2s)
-        antiDriftInterval = setInterval(checkDrift, 1000);
+
+        syncClock();
+        if (clockSyncInterval) clearInterval(clockSyncInterval);
+        clockSyncInterval = setInterval(syncClock, TIME_SYNC_REFRESH_MS);
     });
 
     socket.on('disconnect', () => {
+        // On reconnect we get either the missed events or (e.g. after a server
+        // restart with fresh versions) a full sync_state, so accept anything new
+        if (stateVersion > 0) resumeVersion = stateVersion;
+        stateVersion = 0;
         statusConnection.textContent = 'Disconnected';
         statusConnection.className = 'disconnected';
         statusRole.textContent = 'Viewer';
         isController = false;
         updateControls();
-        if (antiDriftInterval) clearInterval(antiDriftInterval);
+        if (clockSyncInterval) clearInterval(clockSyncInterval);
+    });
+
+    // First event after every (re)connect: who we are, and whether we (still) control the room
+    socket.on('session', (session) => {
+        localSID = session.member_id;
+        resumeToken = session.resume_token;
+        setController(session.controller_sid, session.controller_token, false);
+    });
+
+    socket.on('sync_config', (config) => Object.assign(syncConfig, config));
+
+    socket.on('sync_state', (state) => {
+        if (!acceptVersion(state.version, true)) return;
+        controllerToken = state.controller_token;
+        syncToState(state);
     });
 
-    socket.on('sync_state', (state) => syncToState(state));
+    // Periodic server-pushed state, packed or as JSON:
+    // { t: media time, u: server time it was set, p: playing (1/0), v: version }
+    socket.on('sync_tick', (payload) => {
+        const tick = payload instanceof ArrayBuffer ? unpackEvent(payload)
+            : { time: payload.t, updated_at: payload.u, playing: payload.p === 1, version: payload.v };
+        if (!acceptVersion(tick.version, true)) return;
+        if (isController || !hasJoined || !video.src || video.readyState < 1) return;
+        syncPlayback(positionAt(tick.time, tick.updated_at, tick.playing), tick.playing);
+    });
 
+    // A new video also hands control to its uploader
     socket.on('video_loaded', (data) => {
+        if (!acceptVersion(data.version)) return;
         console.log(`Video Loaded Event: ${data.url}`);
+        cancelScheduledPlay();
         isServerSyncing = true;
         video.src = data.url;
         video.load();
@@ -144,61 +349,52 @@ document.addEventListener('DOMContentLoaded', () => {
         video.currentTime = 0;
         if (uploadStatus) { uploadStatus.textContent = ''; uploadStatus.className = ''; }
         setTimeout(() => { isServerSyncing = false; }, 500);
+        setController(data.controller_sid, data.token);
     });
 
-    socket.on('sync_play', (data) => {
-        if (isController) return; 
-        
-        // Apply Latency Compensation
-        const targetTime = data.time + LATENCY_COMPENSATION;
-        console.log(`SYNC: PLAY at ${data.time} (+${LATENCY_COMPENSATION}s offset)`);
-        
-        // Only jump if we are significantly off, otherwise just play
-        if (Math.abs(video.currentTime - targetTime) > DRIFT_THRESHOLD) {
-            video.currentTime = targetTime;
-        }
-        attemptPlay();
+    socket.on('sync_play', (payload) => {
+        const data = unpackEvent(payload);
+        if (!acceptVersion(data.version) || isController) return;
+        ackSyncEvent(data);
+
+        // The server schedules the start slightly in the future (updated_at) so everyone starts together
+        console.log(`SYNC: PLAY at ${data.time}, starting in ${((data.updated_at - serverNow()) * 1000).toFixed(0)}ms`);
+        schedulePlay(data.time, data.updated_at);
     });
 
-    socket.on('sync_pause', (data) => {
-        if (isController) return; 
+    socket.on('sync_pause', (payload) => {
+        const data = unpackEvent(payload);
+        if (!acceptVersion(data.version) || isController) return;
+        ackSyncEvent(data);
+        cancelScheduledPlay();
         console.log(`SYNC: PAUSE at ${data.time}`);
         video.pause();
         
         // Ensure we pause at the exact frame
-        if (Math.abs(video.currentTime - data.time) > DRIFT_THRESHOLD) {
+        if (Math.abs(video.currentTime - data.time) > syncConfig.seek_threshold) {
             video.currentTime = data.time; 
         }
     });
 
-    socket.on('sync_seek', (data) => {
-        if (isController) return; 
+    socket.on('sync_seek', (payload) => {
+        const data = unpackEvent(payload);
+        if (!acceptVersion(data.version) || isController) return;
+        ackSyncEvent(data);
         console.log(`SYNC: SEEK to ${data.time}`);
         
         isServerSyncing = true;
-        video.currentTime = data.time;
+        video.playbackRate = 1.0;
+        video.currentTime = positionAt(data.time, data.updated_at, data.playing);
         
-        // Force a re-sync shortly after the seek settles
-        // This fixes the "stuck after forward" issue
-        setTimeout(() => { 
-            isServerSyncing = false; 
-            socket.emit('request_sync');
-        }, 1000);
+        // Let the seek settle before drift correction resumes; versioned
+        // sync ticks reconcile any remaining drift without a request_sync
+        setTimeout(() => { isServerSyncing = false; }, 1000);
     });
 
     socket.on('controller_change', (data) => {
+        if (!acceptVersion(data.version)) return;
         console.log(`New Controller: ${data.controller_sid}`);
-        const oldIsController = isController;
-        isController = (data.controller_sid === localSID);
-        statusController.textContent = data.controller_sid || 'None';
-        updateControls();
-
-        if (isController && !oldIsController) {
-             if (uploadStatus) {
-                 uploadStatus.textContent = `Upload successful! You are the new controller.`;
-                 uploadStatus.className = 'success';
-             }
-        }
+        setController(data.controller_sid, data.token);
     });
 
 
@@ -207,13 +403,16 @@ document.addEventListener('DOMContentLoaded', () => {
     video.addEventListener('play', () => {
         if (!isController || isServerSyncing || isSeeking) return;
         console.log("Emitting PLAY");
-        socket.emit('play', { time: video.currentTime });
+        // The server answers with the scheduled start; the controller joins it too
+        socket.emit('play', { time: video.currentTime, token: controllerToken, sent_at: serverNow() }, (ack) => {
+            if (ack && ack.play_at) schedulePlay(ack.time, ack.play_at);
+        });
     });
 
     video.addEventListener('pause', () => {
         if (!isController || isServerSyncing || isSeeking) return;
         console.log("Emitting PAUSE");
-        socket.emit('pause', { time: video.currentTime });
+        socket.emit('pause', { time: video.currentTime, token: controllerToken, sent_at: serverNow() });
     });
 
     video.addEventListener('seeking', () => {
@@ -225,9 +424,108 @@ document.addEventListener('DOMContentLoaded', () => {
         if (!isController || isServerSyncing) return;
         isSeeking = false;
         console.log("Emitting SEEK");
-        socket.emit('seek', { time: video.currentTime });
+        socket.emit('seek', { time: video.currentTime, token: controllerToken, sent_at: serverNow() });
     });
     
+    // --- Chunked, Resumable Upload ---
+
+    async function sha256Hex(file) {
+        // Web Crypto is only available in secure contexts (https / localhost)
+        if (!window.crypto || !crypto.subtle) return null;
+        const digest = await crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+        return Array.from(new Uint8Array(digest), b => b.toString(16).padStart(2, '0')).join('');
+    }
+
+    async function loadStoredVideo(digest) {
+        // Skip the transfer entirely if the server already has this content
+        const head = await fetch(`/videos/by-hash/${digest}`, { method: 'HEAD' });
+        if (!head.ok) return false;
+        const response = await fetch(`/videos/by-hash/${digest}/load`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ sid: localSID, room }),
+        });
+        return response.ok;
+    }
+
+    async function createOrResumeUpload(file, digest) {
+        // Resume an unfinished upload of the same file if the server still knows it
+        const resumeKey = `echostream-upload:${room}:${file.name}:${file.size}:${file.lastModified}`;
+        const savedUrl = localStorage.getItem(resumeKey);
+        if (savedUrl) {
+            const head = await fetch(savedUrl, { method: 'HEAD' });
+            if (head.ok) {
+                return {
+                    resumeKey,
+                    url: savedUrl,
+                    chunkSize: parseInt(head.headers.get('Upload-Chunk-Size'), 10),
+                    offset: parseInt(head.headers.get('Upload-Offset'), 10),
+                };
+            }
+            localStorage.removeItem(resumeKey);
+        }
+
+        const response = await fetch('/uploads', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ filename: file.name, size: file.size, sid: localSID, room, digest }),
+        });
+        const info = await response.json();
+        if (!response.ok) throw new Error(info.error);
+        localStorage.setItem(resumeKey, info.url);
+        return { resumeKey, url: info.url, chunkSize: info.chunk_size, offset: 0 };
+    }
+
+    async function sendChunk(url, file, start, end) {
+        for (let attempt = 1; ; attempt++) {
+            try {
+                const response = await fetch(url, {
+                    method: 'PATCH',
+                    headers: {
+                        'Upload-Offset': String(start),
+                        'X-Client-Sid': localSID,
+                        'Content-Type': 'application/offset+octet-stream',
+                    },
+                    body: file.slice(start, end),
+                });
+                if (response.ok) return;
+                if (response.status < 500 || attempt >= UPLOAD_RETRIES) {
+                    const err = await response.json().catch(() => ({}));
+                    throw new Error(err.error || `HTTP ${response.status}`);
+                }
+            } catch (error) {
+                if (attempt >= UPLOAD_RETRIES) throw error;
+            }
+            await new Promise(resolve => setTimeout(resolve, 1000 * attempt));
+        }
+    }
+
+    async function uploadFile(file) {
+        uploadStatus.textContent = 'Checking...';
+        const digest = await sha256Hex(file);
+        if (digest && await loadStoredVideo(digest)) return;
+
+        const upload = await createOrResumeUpload(file, digest);
+        const pending = [];
+        for (let start = upload.offset; start < file.size; start += upload.chunkSize) {
+            pending.push(start);
+        }
+        const total = pending.length;
+        let done = 0;
+
+        // A few chunks in flight at once; the server writes each at its own offset
+        async function worker() {
+            while (pending.length) {
+                const start = pending.shift();
+                await sendChunk(upload.url, file, start, Math.min(start + upload.chunkSize, file.size));
+                done++;
+                uploadStatus.textContent = `Uploading... ${Math.round(100 * done / total)}%`;
+            }
+        }
+        await Promise.all(Array.from({ length: PARALLEL_UPLOADS }, worker));
+        localStorage.removeItem(upload.resumeKey);
+    }
+
     // Upload Form
     if (uploadForm) {
         uploadForm.addEventListener('submit', (e) => {
@@ -235,23 +533,10 @@ document.addEventListener('DOMContentLoaded', () => {
             if (!fileInput.files.length) return;
             if (!localSID) return;
 
-            const formData = new FormData();
-            formData.append('file', fileInput.files[0]);
-            formData.append('sid', localSID); 
-
             uploadStatus.textContent = 'Uploading...';
             uploadStatus.className = '';
 
-            fetch('/upload', { method: 'POST', body: formData })
-            .then(response => {
-                if (!response.ok) {
-                    return response.json().then(err => {
-                         uploadStatus.textContent = `Error: ${err.error}`;
-                         uploadStatus.className = 'error';
-                    });
-                }
-            })
-            .catch(error => {
+            uploadFile(fileInput.files[0]).catch(error => {
                 uploadStatus.textContent = `Error: ${error.message}`;
                 uploadStatus.className = 'error';
             });
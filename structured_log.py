@@ -0,0 +1,165 @@
+"""
+Non-blocking structured logging.
+
+`log.info("play", "▶️ Controller PLAY", member=member, time=t)` never
+touches stdout itself: the record is filtered by level, sampled per event,
+and handed to a native writer thread through a bounded queue. A slow log
+pipe then only delays the log, never the eventlet hub and the sync fan-out
+running on it. When the queue is full records are dropped, and the writer
+reports how many it lost as a `log_records_dropped` record.
+
+Configured from the environment:
+    ECHOSTREAM_LOG_LEVEL    DEBUG, INFO (default), WARNING or ERROR
+    ECHOSTREAM_LOG_FORMAT   text (default) or json (one object per line)
+    ECHOSTREAM_LOG_SAMPLE   per-event sampling, e.g. "broadcast=0.01,seek=0.1":
+                            1 in 100 broadcast records is written, and it
+                            carries how many it stands for in `sampled`
+    ECHOSTREAM_LOG_QUEUE    records buffered before dropping (default 10000)
+"""
+import atexit
+import json
+import os
+import sys
+import time
+
+try:
+    # The writer must be a real OS thread (blocking writes must not stall
+    # the hub), even when the server has monkey-patched threading
+    from eventlet.patcher import original
+    _threading = original("threading")
+    _queue = original("queue")
+except ImportError:
+    import threading as _threading
+    import queue as _queue
+
+DEBUG, INFO, WARNING, ERROR = 10, 20, 30, 40
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+
+
+def parse_sample_rates(spec):
+    """"broadcast=0.01,seek=0.1" -> {"broadcast": 100, "seek": 10} (write 1 record in N)."""
+    rates = {}
+    for part in (spec or "").split(","):
+        name, _, rate = part.partition("=")
+        try:
+            rate = float(rate)
+        except ValueError:
+            continue
+        if name.strip() and 0 < rate < 1:
+            rates[name.strip()] = max(1, int(round(1 / rate)))
+    return rates
+
+
+class StructuredLogger:
+
+    def __init__(self, level=INFO, fmt="text", sample_rates=None, queue_size=10000, stream=None):
+        self.level = level
+        self.json = fmt == "json"
+        self.sample_every = sample_rates or {}
+        self.seen = {}           # event -> records seen, for sampled events
+        self.records = _queue.Queue(maxsize=queue_size)
+        self.dropped = 0         # Only incremented by producers...
+        self.reported_dropped = 0  # ...and only read by the writer, so no lock is needed
+        self.stream = stream or sys.stdout
+        self.writer = None
+
+    @classmethod
+    def from_env(cls):
+        level_name = os.environ.get("ECHOSTREAM_LOG_LEVEL", "INFO").upper()
+        level = next((value for value, name in LEVEL_NAMES.items() if name == level_name), INFO)
+        return cls(
+            level=level,
+            fmt=os.environ.get("ECHOSTREAM_LOG_FORMAT", "text").lower(),
+            sample_rates=parse_sample_rates(os.environ.get("ECHOSTREAM_LOG_SAMPLE")),
+            queue_size=int(os.environ.get("ECHOSTREAM_LOG_QUEUE", 10000)),
+        )
+
+    # --- Producer Side (runs on the hub; must never block) ---
+
+    def log(self, level, event, message="", **fields):
+        if level < self.level:
+            return
+        every = self.sample_every.get(event)
+        if every is not None:
+            seen = self.seen.get(event, 0) + 1
+            self.seen[event] = seen
+            if seen % every:
+                return
+            fields["sampled"] = every
+        if self.writer is None:
+            self.start()
+        try:
+            self.records.put_nowait((time.time(), level, event, message, fields))
+        except _queue.Full:
+            self.dropped += 1
+
+    def debug(self, event, message="", **fields):
+        self.log(DEBUG, event, message, **fields)
+
+    def info(self, event, message="", **fields):
+        self.log(INFO, event, message, **fields)
+
+    def warning(self, event, message="", **fields):
+        self.log(WARNING, event, message, **fields)
+
+    def error(self, event, message="", **fields):
+        self.log(ERROR, event, message, **fields)
+
+    # --- Writer Side (native thread) ---
+
+    def start(self):
+        self.writer = _threading.Thread(target=self.run, name="log-writer", daemon=True)
+        self.writer.start()
+        atexit.register(self.flush)
+
+    def format(self, record):
+        created, level, event, message, fields = record
+        if self.json:
+            entry = {"ts": round(created, 6), "level": LEVEL_NAMES[level], "event": event}
+            if message:
+                entry["msg"] = message
+            entry.update(fields)
+            return json.dumps(entry, default=str, ensure_ascii=False)
+        stamp = time.strftime("%H:%M:%S", time.localtime(created)) + f".{int(created % 1 * 1000):03d}"
+        details = " ".join(f"{key}={value}" for key, value in fields.items())
+        return " ".join(part for part in (stamp, LEVEL_NAMES[level], message or event, details) if part)
+
+    def write_batch(self, batch):
+        lines = [self.format(record) for record in batch]
+        dropped = self.dropped
+        if dropped > self.reported_dropped:
+            lines.append(self.format((time.time(), WARNING, "log_records_dropped",
+                                      "⚠️ Log queue full; records dropped",
+                                      {"count": dropped - self.reported_dropped})))
+            self.reported_dropped = dropped
+        try:
+            self.stream.write("\n".join(lines) + "\n")
+            self.stream.flush()
+        except (OSError, ValueError):
+            pass  # Closed or broken pipe: there is nowhere left to log to
+
+    def run(self):
+        while True:
+            batch = [self.records.get()]
+            # Write whatever else is already queued in the same syscall
+            while len(batch) < 500:
+                try:
+                    batch.append(self.records.get_nowait())
+                except _queue.Empty:
+                    break
+            self.write_batch(batch)
+
+    def flush(self, timeout=1.0):
+        """Writes what is still queued (at exit), giving up after `timeout` seconds."""
+        deadline = time.time() + timeout
+        batch = []
+        while time.time() < deadline:
+            try:
+                batch.append(self.records.get_nowait())
+            except _queue.Empty:
+                break
+        if batch:
+            self.write_batch(batch)
+
+
+log = StructuredLogger.from_env()
@@ -0,0 +1,86 @@
+import os
+
+# --- Deployment ---
+# Redis backs the redis state backend and, in multi-worker mode, the
+# Socket.IO message queue. Nothing here imports redis, so a memory-backed
+# server never loads it.
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+DEFAULT_ROOM = "lobby"  # Room of clients that don't ask for a valid one
+
+# --- Sync Tuning ---
+# Every value can be overridden with an environment variable of the same name
+# prefixed with ECHOSTREAM_, e.g. ECHOSTREAM_HARD_SEEK_THRESHOLD=0.5.
+
+def _env_float(name, default):
+    return float(os.environ.get(f"ECHOSTREAM_{name}", default))
+
+# Server-pushed sync ticks
+SYNC_TICK_INTERVAL = _env_float("SYNC_TICK_INTERVAL", 1.0)  # Seconds between ticks
+
+# Room event streams: approximate events kept per room for catch-up replay,
+# and how long one XREAD waits (which also bounds how late a newly joined
+# room's stream starts being tailed)
+EVENT_STREAM_MAXLEN = int(_env_float("EVENT_STREAM_MAXLEN", 1000))
+EVENT_READ_BLOCK = _env_float("EVENT_READ_BLOCK", 0.1)
+EVENT_READ_COUNT = int(_env_float("EVENT_READ_COUNT", 100))
+
+# Scheduled starts: play begins at now + lead, where the lead tracks the p95
+# fan-out latency reported by viewers' sync_ack messages
+DEFAULT_PLAY_LEAD = _env_float("DEFAULT_PLAY_LEAD", 0.3)
+MIN_PLAY_LEAD = _env_float("MIN_PLAY_LEAD", 0.1)
+MAX_PLAY_LEAD = _env_float("MAX_PLAY_LEAD", 1.0)
+PLAY_LEAD_MARGIN = _env_float("PLAY_LEAD_MARGIN", 0.05)
+MIN_LEAD_SAMPLES = int(_env_float("MIN_LEAD_SAMPLES", 20))
+
+# Seek coalescing: a controller's seeks are applied once the room has been
+# quiet for the window (trailing edge), or at the latest after the max delay
+# during a continuous scrub. A window of 0 applies every seek immediately.
+SEEK_COALESCE_WINDOW = _env_float("SEEK_COALESCE_WINDOW", 0.15)
+SEEK_COALESCE_MAX_DELAY = _env_float("SEEK_COALESCE_MAX_DELAY", 0.5)
+
+# Slow consumers: a client with more than OUTBOX_HIGH_WATER packets waiting
+# in its Engine.IO queue gets its events parked in an outbox (latest state
+# wins) until the backlog is back under OUTBOX_LOW_WATER
+OUTBOX_HIGH_WATER = int(_env_float("OUTBOX_HIGH_WATER", 64))
+OUTBOX_LOW_WATER = int(_env_float("OUTBOX_LOW_WATER", 8))
+OUTBOX_MAX_EVENTS = int(_env_float("OUTBOX_MAX_EVENTS", 32))   # Non-collapsible events parked per client
+OUTBOX_CHECK_INTERVAL = _env_float("OUTBOX_CHECK_INTERVAL", 0.25)
+
+# Presence: every node refreshes its members' heartbeats in one batch per
+# interval; members not seen for PRESENCE_TTL (e.g. on a crashed node) are
+# evicted by whichever node holds the reaper lock that round
+PRESENCE_HEARTBEAT_INTERVAL = _env_float("PRESENCE_HEARTBEAT_INTERVAL", 10.0)
+PRESENCE_TTL = _env_float("PRESENCE_TTL", 30.0)
+PRESENCE_REAP_INTERVAL = _env_float("PRESENCE_REAP_INTERVAL", 10.0)
+# A member that disconnects keeps its presence and role for RESUME_GRACE
+# seconds, and gets both back if it reconnects with its resume token. Keep it
+# above PRESENCE_HEARTBEAT_INTERVAL: a member that reconnected to another node
+# is recognized by a heartbeat newer than its disconnect.
+RESUME_GRACE = _env_float("RESUME_GRACE", 15.0)
+RESUME_TOKEN_MAX_AGE = _env_float("RESUME_TOKEN_MAX_AGE", 86400.0)
+# The controller's lease is renewed with every heartbeat and expires (handing
+# control to someone else at the next reap) if its node stops renewing it
+CONTROLLER_LEASE_TTL = _env_float("CONTROLLER_LEASE_TTL", 30.0)
+
+# Fraction of control events traced hop by hop (see tracing.py); 0 disables tracing
+TRACE_SAMPLE_RATE = _env_float("TRACE_SAMPLE_RATE", 0.0)
+
+# Client drift correction (pushed to every client on connect)
+DRIFT_DEADBAND = _env_float("DRIFT_DEADBAND", 0.04)             # Below this drift, play at normal speed
+HARD_SEEK_THRESHOLD = _env_float("HARD_SEEK_THRESHOLD", 1.0)    # Above this, seek instead of nudging the rate
+SEEK_THRESHOLD = _env_float("SEEK_THRESHOLD", 0.25)             # Seek threshold when the rate can't be used (paused, discrete events)
+RATE_GAIN = _env_float("RATE_GAIN", 0.5)                        # playbackRate change per second of drift
+MAX_RATE_ADJUSTMENT = _env_float("MAX_RATE_ADJUSTMENT", 0.05)   # playbackRate stays within 1 +/- this
+FANOUT_ACK_SAMPLE_RATE = _env_float("FANOUT_ACK_SAMPLE_RATE", 0.1)
+
+
+def client_sync_config():
+    """The subset of the tuning that clients need, sent as the `sync_config` event."""
+    return {
+        "drift_deadband": DRIFT_DEADBAND,
+        "hard_seek_threshold": HARD_SEEK_THRESHOLD,
+        "seek_threshold": SEEK_THRESHOLD,
+        "rate_gain": RATE_GAIN,
+        "max_rate_adjustment": MAX_RATE_ADJUSTMENT,
+        "fanout_ack_sample_rate": FANOUT_ACK_SAMPLE_RATE,
+    }
@@ -0,0 +1,134 @@
+"""
+End-to-end tracing of control events.
+
+A sampled control event gets a trace context at ingress (the controller's
+send time, if it reported one, and the server's receipt time), which is
+stored in its event stream entry next to the event itself. Every node that
+relays the event then knows the whole path and writes one record per hop
+boundary:
+
+    trace_commit   on the ingress node, once the EVALSHA returned
+                   uplink = ingress - sent, commit = committed - ingress
+    trace_emit     on every relaying node
+                   store = stream entry time - ingress (Redis clock),
+                   dispatch = listener receipt - stream entry time,
+                   emit = emitted - listener receipt
+    trace_ack      on the node a viewer is connected to, when it acks
+                   delivery = viewer receipt - emitted, total = viewer receipt - sent
+
+All durations are in seconds; records share the trace `id`, so a collector
+can join them. Records go to a JSON-lines file (ECHOSTREAM_TRACE_FILE,
+default traces.jsonl) or, as UDP datagrams, to ECHOSTREAM_TRACE_COLLECTOR
+(host:port), written by the same non-blocking writer the logs use.
+"""
+import json
+import os
+import random
+import time
+import uuid
+from collections import OrderedDict
+
+from structured_log import StructuredLogger, INFO
+
+try:
+    from eventlet.patcher import original
+    _socket = original("socket")
+except ImportError:
+    import socket as _socket
+
+
+class UdpSink:
+    """File-like sink sending every line as one datagram (used from the native writer thread)."""
+
+    def __init__(self, address):
+        host, _, port = address.rpartition(":")
+        self.address = (host or "127.0.0.1", int(port))
+        self.sock = _socket.socket(_socket.AF_INET, _socket.SOCK_DGRAM)
+
+    def write(self, text):
+        for line in text.splitlines():
+            try:
+                self.sock.sendto(line.encode(), self.address)
+            except OSError:
+                pass  # Collector unreachable; traces are best effort
+
+    def flush(self):
+        pass
+
+
+def _since(end, start):
+    if end is None or start is None:
+        return None
+    return round(end - start, 6)
+
+
+class Tracer:
+
+    def __init__(self, sample_rate, writer, node, max_emitted=256):
+        self.sample_rate = sample_rate
+        self.writer = writer
+        self.node = node
+        # Emit time of recently relayed traces, to time viewer acks against
+        self.emitted_at = OrderedDict()
+        self.max_emitted = max_emitted
+
+    @classmethod
+    def from_env(cls, sample_rate, node):
+        if sample_rate <= 0:
+            return cls(0.0, None, node)
+        collector = os.environ.get("ECHOSTREAM_TRACE_COLLECTOR")
+        if collector:
+            sink = UdpSink(collector)
+        else:
+            sink = open(os.environ.get("ECHOSTREAM_TRACE_FILE", "traces.jsonl"), "a", encoding="utf-8")
+        return cls(sample_rate, StructuredLogger(level=INFO, fmt="json", stream=sink), node)
+
+    def begin(self, sent_at=None):
+        """A new trace context for a control event received now, or None if it isn't sampled."""
+        if not self.sample_rate or random.random() >= self.sample_rate:
+            return None
+        try:
+            sent_at = float(sent_at) if sent_at is not None else None
+        except (TypeError, ValueError):
+            sent_at = None
+        return {"id": uuid.uuid4().hex[:16], "sent": sent_at, "ingress": time.time()}
+
+    @staticmethod
+    def serialize(context):
+        # Stored in the event's stream entry ("" when untraced)
+        return json.dumps(context, separators=(",", ":")) if context else ""
+
+    def committed(self, context, room, event, version):
+        now = time.time()
+        self.writer.info("trace_commit", id=context["id"], node=self.node, room=room, event_name=event,
+                         version=version, uplink=_since(context["ingress"], context["sent"]),
+                         commit=_since(now, context["ingress"]))
+
+    @staticmethod
+    def parse(raw_context):
+        """The trace context stored in a stream entry (bytes or str), or None."""
+        if not raw_context:
+            return None
+        try:
+            return json.loads(raw_context)
+        except ValueError:
+            return None
+
+    def emitted(self, context, room, event, entry_time, received):
+        """Records the local relay of a traced event, which just finished."""
+        emitted = time.time()
+        trace_id = context.get("id")
+        self.emitted_at[trace_id] = (emitted, context.get("sent"))
+        if len(self.emitted_at) > self.max_emitted:
+            self.emitted_at.popitem(last=False)
+        self.writer.info("trace_emit", id=trace_id, node=self.node, room=room, event_name=event,
+                         store=_since(entry_time, context.get("ingress")), dispatch=_since(received, entry_time),
+                         emit=_since(emitted, received))
+
+    def acked(self, trace_id, sid, received_at):
+        emitted = self.emitted_at.get(trace_id)
+        if emitted is None:
+            return
+        emitted_at, sent = emitted
+        self.writer.info("trace_ack", id=trace_id, node=self.node, sid=sid,
+                         delivery=_since(received_at, emitted_at), total=_since(received_at, sent))
@@ -0,0 +1,164 @@
+"""
+HTTP Range-aware video streaming.
+
+Serves uploaded videos with `206 Partial Content` for single and multiple
+byte ranges, strong ETags and long-lived immutable caching. When the WSGI
+server offers `wsgi.file_wrapper` (e.g. gunicorn) single ranges that run to
+the end of the file are handed to it so the kernel can send them with
+sendfile(); otherwise ranges are streamed in large chunks with os.pread(),
+which never touches a shared file offset.
+"""
+import os
+import secrets
+
+from flask import Response, request
+
+CHUNK_SIZE = 256 * 1024
+MAX_RANGES = 16  # More ranges than this are answered with the full file
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+MIME_TYPES = {
+    "mp4": "video/mp4",
+    "webm": "video/webm",
+    "ogg": "video/ogg",
+}
+
+
+def make_etag(stat_result):
+    """Strong (unquoted) ETag derived from size, mtime and inode; changes whenever the file is replaced."""
+    return f"{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}-{stat_result.st_ino:x}"
+
+
+def resolve_ranges(range_header, size):
+    """
+    Turns the parsed Range header into a sorted list of non-overlapping
+    inclusive (start, end) byte ranges. Returns None to serve the full file
+    and an empty list if none of the ranges can be satisfied.
+    """
+    if range_header is None or range_header.units != "bytes" or size == 0:
+        return None
+
+    ranges = []
+    for begin, stop in range_header.ranges:
+        if begin < 0:
+            # Suffix range: the last -begin bytes
+            start, end = max(0, size + begin), size - 1
+        else:
+            start = begin
+            end = size - 1 if stop is None else min(stop, size) - 1
+        if start < size and start <= end:
+            ranges.append((start, end))
+
+    if len(range_header.ranges) > MAX_RANGES:
+        return None
+    if not ranges:
+        return []
+
+    # Merge overlapping / adjacent ranges so no byte is sent twice
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        last_start, last_end = merged[-1]
+        if start <= last_end + 1:
+            merged[-1] = (last_start, max(last_end, end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def iter_file_range(path, start, end):
+    """Yields the bytes [start, end] of `path` in CHUNK_SIZE pieces."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        offset = start
+        while offset <= end:
+            data = os.pread(fd, min(CHUNK_SIZE, end - offset + 1), offset)
+            if not data:
+                break
+            offset += len(data)
+            yield data
+    finally:
+        os.close(fd)
+
+
+def part_header(boundary, mimetype, start, end, size):
+    return (
+        f"\r\n--{boundary}\r\n"
+        f"Content-Type: {mimetype}\r\n"
+        f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+    ).encode()
+
+
+def closing_boundary(boundary):
+    return f"\r\n--{boundary}--\r\n".encode()
+
+
+def iter_multipart(path, ranges, size, boundary, mimetype):
+    for start, end in ranges:
+        yield part_header(boundary, mimetype, start, end, size)
+        yield from iter_file_range(path, start, end)
+    yield closing_boundary(boundary)
+
+
+def file_body(path, start, end, size):
+    """
+    Body for a single contiguous range. Uses the server's file_wrapper (sendfile)
+    when available and the range runs to EOF, since the wrapper streams the
+    file to its end; otherwise falls back to chunked pread().
+    """
+    file_wrapper = request.environ.get("wsgi.file_wrapper")
+    if file_wrapper is not None and end == size - 1:
+        f = open(path, "rb")
+        f.seek(start)
+        return file_wrapper(f, CHUNK_SIZE)
+    return iter_file_range(path, start, end)
+
+
+def send_video(path, etag=None):
+    """
+    Builds the (possibly partial) response for the video file at `path`.
+    `etag` (unquoted) overrides the stat-based ETag, e.g. with a content digest.
+    """
+    stat_result = os.stat(path)
+    size = stat_result.st_size
+    etag = etag or make_etag(stat_result)
+    mimetype = MIME_TYPES.get(path.rsplit(".", 1)[-1].lower(), "application/octet-stream")
+    headers = {
+        "ETag": f'"{etag}"',
+        "Accept-Ranges": "bytes",
+        "Cache-Control": CACHE_CONTROL,
+    }
+
+    if request.if_none_match.contains(etag):
+        return Response(status=304, headers=headers)
+
+    # A Range request with a stale If-Range validator gets the whole file
+    ranges = resolve_ranges(request.range, size)
+    if_range = request.if_range
+    if ranges and (if_range.date is not None or (if_range.etag and if_range.etag != etag)):
+        ranges = None
+
+    if ranges == []:
+        headers["Content-Range"] = f"bytes */{size}"
+        return Response(status=416, headers=headers)
+
+    if ranges is None:
+        headers["Content-Length"] = str(size)
+        return Response(file_body(path, 0, size - 1, size), status=200, headers=headers,
+                        mimetype=mimetype, direct_passthrough=True)
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+        return Response(file_body(path, start, end, size), status=206, headers=headers,
+                        mimetype=mimetype, direct_passthrough=True)
+
+    boundary = secrets.token_hex(16)
+    body_length = sum(
+        len(part_header(boundary, mimetype, start, end, size)) + (end - start + 1)
+        for start, end in ranges
+    )
+    headers["Content-Length"] = str(body_length + len(closing_boundary(boundary)))
+    return Response(iter_multipart(path, ranges, size, boundary, mimetype), status=206, headers=headers,
+                    content_type=f"multipart/byteranges; boundary={boundary}", direct_passthrough=True)
@@ -0,0 +1,67 @@
+"""
+Compact binary encoding of playback events.
+
+Play, pause, seek and tick events are almost all numbers, so instead of a
+JSON object they can travel as one fixed 30-byte little-endian struct:
+
+    offset  size  field
+    0       1     event code (see EVENT_CODES)
+    1       1     flags (bit 0: playing)
+    2       4     state version (uint32)
+    6       8     media time, seconds (float64)
+    14      8     server time the media time is valid at (float64)
+    22      8     server time the command was issued, 0 for ticks (float64)
+
+The control-transition Lua script packs the same layout with
+`struct.pack(PACK_FORMAT_LUA, ...)`, so the bytes stored in the room's event
+stream are forwarded to binary clients without being re-encoded. Clients opt
+in with the `wire=binary` connect query parameter; everyone else keeps
+receiving JSON objects.
+"""
+import struct
+
+BINARY = "binary"
+JSON = "json"
+
+PLAYBACK_EVENT = struct.Struct("<BBIddd")
+PACK_FORMAT_LUA = "<BBI4ddd"  # Same layout in the syntax of Redis's Lua struct library
+
+EVENT_CODES = {
+    "sync_play": 1,
+    "sync_pause": 2,
+    "sync_seek": 3,
+    "sync_tick": 4,
+}
+EVENT_NAMES = {code: name for name, code in EVENT_CODES.items()}
+
+FLAG_PLAYING = 0x01
+
+
+def negotiate(requested):
+    """The encoding to use for a client that asked for `requested` (None means JSON)."""
+    return BINARY if requested == BINARY else JSON
+
+
+def encode(event_name, media_time, updated_at, playing, version, issued_at=0.0):
+    return PLAYBACK_EVENT.pack(
+        EVENT_CODES[event_name],
+        FLAG_PLAYING if playing else 0,
+        version,
+        media_time,
+        updated_at,
+        issued_at
+    )
+
+
+def decode(payload):
+    """Returns (event name, data) for a packed event, with data in the JSON event shape."""
+    code, flags, version, media_time, updated_at, issued_at = PLAYBACK_EVENT.unpack(payload)
+    data = {
+        "time": media_time,
+        "updated_at": updated_at,
+        "playing": bool(flags & FLAG_PLAYING),
+        "version": version,
+    }
+    if issued_at:
+        data["issued_at"] = issued_at
+    return EVENT_NAMES[code], data